@@ -0,0 +1,48 @@
+"""store email template in outbox
+
+Revision ID: 0f5c1a7e9d42
+Revises: b6f3d8e2a917
+Create Date: 2026-10-18 15:52:10.604518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '0f5c1a7e9d42'
+down_revision: Union[str, None] = 'b6f3d8e2a917'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # rows written before templates keep their rendered email as params of 'prerendered' template
+    op.add_column('email_outbox', sa.Column('template_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False,
+                                            server_default='prerendered'))
+    op.add_column('email_outbox', sa.Column('params', postgresql.JSONB(astext_type=sa.Text()), nullable=False,
+                                            server_default=sa.text("'{}'::jsonb")))
+    op.execute("UPDATE email_outbox SET params = jsonb_build_object('subject', subject, 'body', body)")
+    op.alter_column('email_outbox', 'template_id', server_default=None)
+    op.alter_column('email_outbox', 'params', server_default=None)
+    op.drop_column('email_outbox', 'body')
+    op.drop_column('email_outbox', 'subject')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # previous code can't render templates, so only prerendered rows are kept
+    op.execute("DELETE FROM email_outbox WHERE template_id <> 'prerendered'")
+    op.add_column('email_outbox', sa.Column('subject', sa.VARCHAR(), autoincrement=False, nullable=False,
+                                            server_default=''))
+    op.add_column('email_outbox', sa.Column('body', sa.VARCHAR(), autoincrement=False, nullable=False,
+                                            server_default=''))
+    op.execute("UPDATE email_outbox SET subject = params ->> 'subject', body = params ->> 'body'")
+    op.alter_column('email_outbox', 'subject', server_default=None)
+    op.alter_column('email_outbox', 'body', server_default=None)
+    op.drop_column('email_outbox', 'params')
+    op.drop_column('email_outbox', 'template_id')
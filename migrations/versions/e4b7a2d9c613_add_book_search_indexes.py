@@ -0,0 +1,36 @@
+"""add book search indexes
+
+Revision ID: e4b7a2d9c613
+Revises: 8c1d4e7a5f20
+Create Date: 2026-10-18 12:21:07.530914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b7a2d9c613'
+down_revision: Union[str, None] = '8c1d4e7a5f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # expression has to stay the same as book_search_vector in src/db/models.py, otherwise index is not used
+    op.create_index('ix_books_search', 'books',
+                    [sa.text("(setweight(to_tsvector('simple'::regconfig, title), 'A') || "
+                             "setweight(to_tsvector('simple'::regconfig, author), 'B') || "
+                             "setweight(to_tsvector('simple'::regconfig, publisher), 'C'))")],
+                    unique=False, postgresql_using='gin')
+    op.create_index('ix_books_language_page_count', 'books', ['language', 'page_count'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_books_language_page_count', table_name='books')
+    op.drop_index('ix_books_search', table_name='books', postgresql_using='gin')
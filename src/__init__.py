@@ -1,12 +1,19 @@
+import asyncio
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
+from src.auth.dependencies import access_token_bearer, RoleChecker
 from src.auth.routes import auth_router
+from src.auth.utils import get_password_hash_pool_stats
 from src.books.routes import book_router
-from src.db.main import init_db
+from src.db.main import init_db, get_pool_stats
+from src.db.outbox import run_outbox_relay
+from src.db.redis import run_blocklist_filter_refresh
 from src.errors import register_all_errors
-from src.middleware import register_middleware
+from src.middleware import access_log_listener, register_middleware
 from src.reviews.routes import review_router
 
 
@@ -14,9 +21,15 @@ from src.reviews.routes import review_router
 async def life_span(app: FastAPI):
     print(f'Server is starting...')
 
+    access_log_listener.start()
     await init_db()
+    blocklist_refresh_task = asyncio.create_task(run_blocklist_filter_refresh())
+    outbox_relay_task = asyncio.create_task(run_outbox_relay())
     yield
 
+    outbox_relay_task.cancel()
+    blocklist_refresh_task.cancel()
+    access_log_listener.stop()  # writes records that are still in queue
     print(f'Server has been stopped')
 
 version = 'v1'
@@ -31,8 +44,36 @@ app = FastAPI(
     openapi_url=f'/openapi.json',
 )
 register_all_errors(app)
-register_middleware(app)
+register_middleware(app, version_prefix)
 
 app.include_router(auth_router, prefix=f'{version_prefix}/auth', tags=['auth'])
 app.include_router(book_router, prefix=f'{version_prefix}/books', tags=['books'])
 app.include_router(review_router, prefix=f'{version_prefix}/reviews', tags=['reviews'])
+
+
+@app.get(f'{version_prefix}/db_pool_stats',
+         tags=['monitoring'],
+         dependencies=[Depends(access_token_bearer), Depends(RoleChecker(['admin']))])
+async def db_pool_stats():
+    """
+    Return db connection pool usage
+    """
+    return get_pool_stats()
+
+
+@app.get(f'{version_prefix}/password_hash_pool_stats',
+         tags=['monitoring'],
+         dependencies=[Depends(access_token_bearer), Depends(RoleChecker(['admin']))])
+async def password_hash_pool_stats():
+    """
+    Return bcrypt thread pool usage (queue depth, completed / failed / rejected calls)
+    """
+    return get_password_hash_pool_stats()
+
+
+@app.get('/metrics', tags=['monitoring'], include_in_schema=False)
+async def metrics():
+    """
+    Return metrics in prometheus text format
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,16 +1,23 @@
+import logging
+import time
 from typing import List, Optional
 
 from fastapi import Request, Depends
 from fastapi.security import HTTPBearer
 from fastapi.security.http import HTTPAuthorizationCredentials
+from redis.exceptions import RedisError
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from src.cache import TTLCache
+from src.config import Config
+from src.db.loaders import Loaders, get_loaders
 from src.db.main import get_session
-from src.db.models import User
-from src.db.redis import token_in_blocklist
+from src.db.redis import take_bucket_tokens, token_in_blocklist
 from src.errors import (AccessTokenRequiredException, AccountNotVerifiedException,
-                        InvalidTokenException, RevokedTokenException,
-                        RefreshTokenRequiredException, InsufficientPermissionException)
+                        InvalidTokenException, RevokedTokenException, UserNotFoundException,
+                        RefreshTokenRequiredException, InsufficientPermissionException,
+                        RateLimitExceededException)
+from .schemas import UserPrincipal
 from .service import UserService
 from .utils import decode_access_token
 
@@ -24,22 +31,25 @@ class TokenBearer(HTTPBearer):
     async def __call__(self, request: Request) -> HTTPAuthorizationCredentials | None:
         creds = await super().__call__(request)
         token = creds.credentials
-        token_data = decode_access_token(token)
 
-        if not self.token_valid(token):
-            raise InvalidTokenException()
+        # several auth dependencies can run per request, so verify token only once and reuse claims
+        verified_token = getattr(request.state, 'verified_token', None)
+        if verified_token and verified_token[0] == token:
+            token_data = verified_token[1]
+        else:
+            token_data = decode_access_token(token)
+            if not token_data:
+                raise InvalidTokenException()
 
-        if await token_in_blocklist(token_data['jti']):
-            raise RevokedTokenException()
+            if await token_in_blocklist(token_data['jti']):
+                raise RevokedTokenException()
+
+            request.state.verified_token = (token, token_data)
 
         self.verify_token_data(token_data)
 
         return token_data
 
-    def token_valid(self, token: str) -> bool:
-        token_data = decode_access_token(token)
-        return bool(token_data)
-
     def verify_token_data(self, token_data: dict):
         raise NotImplementedError('Please override this method in child classes')
 
@@ -56,18 +66,35 @@ class RefreshTokenBearer(TokenBearer):
             raise RefreshTokenRequiredException()
 
 
-async def get_current_user(token_details: dict = Depends(AccessTokenBearer()),
-                           session: AsyncSession = Depends(get_session)):
+# shared instance, so FastAPI resolves it only once per request for all dependencies using it
+access_token_bearer = AccessTokenBearer()
+
+
+async def get_current_user(token_details: dict = Depends(access_token_bearer),
+                           loaders: Loaders = Depends(get_loaders)):
+    # loaded through request loaders, so services asking for the same user later don't query it again
     user_email = token_details['user']['email']
-    user = await user_service.get_user_by_email(user_email, session)
+    user = await loaders.users_by_email.load(user_email)
     return user
 
 
+async def get_current_principal(token_details: dict = Depends(access_token_bearer),
+                                session: AsyncSession = Depends(get_session)) -> UserPrincipal:
+    """
+    Return only user fields needed for auth checks (cheaper than loading full user)
+    """
+    user_uid = token_details['user']['user_uid']
+    principal = await user_service.get_user_principal(user_uid, session)
+    if not principal:
+        raise UserNotFoundException()
+    return principal
+
+
 class RoleChecker:
     def __init__(self, allowed_roles: Optional[List[str]] = None) -> None:
         self.allowed_roles = allowed_roles or ['admin',]
 
-    def __call__(self, current_user: User = Depends(get_current_user)) -> bool:
+    def __call__(self, current_user: UserPrincipal = Depends(get_current_principal)) -> bool:
         if not current_user.is_verified:
             raise AccountNotVerifiedException()
 
@@ -75,3 +102,83 @@ class RoleChecker:
             raise InsufficientPermissionException()
 
         return True
+
+
+# tokens leased from redis buckets and spent locally ([remaining]), and buckets known to be empty (until when)
+leased_tokens = TTLCache(maxsize=Config.RATE_LIMIT_CACHE_SIZE, ttl=Config.RATE_LIMIT_LEASE_TTL)
+# requests per bucket during current lease ttl window ([count]), size of next lease follows it
+recent_requests = TTLCache(maxsize=Config.RATE_LIMIT_CACHE_SIZE, ttl=Config.RATE_LIMIT_LEASE_TTL)
+denied_buckets = TTLCache(maxsize=Config.RATE_LIMIT_CACHE_SIZE, ttl=3600)
+
+
+def parse_rate(rate: str) -> tuple[int, float]:
+    capacity, period = rate.split('/')
+    return int(capacity), float(period)
+
+
+async def take_rate_limit_token(key: str, capacity: int, period: float) -> None:
+    """
+    Take one token from bucket or raise RateLimitExceededException.
+    Redis is asked only when local lease is spent, buckets found empty are denied locally until refill.
+    Leased tokens that aren't spent within lease ttl are lost, so only bursting buckets lease more than one.
+    """
+    requests = recent_requests.get(key)
+    if requests is None:
+        requests = [0]
+        recent_requests.set(key, requests)
+    requests[0] += 1
+
+    denied_until = denied_buckets.get(key)
+    if denied_until is not None:
+        raise RateLimitExceededException(retry_after=denied_until - time.monotonic())
+
+    lease = leased_tokens.get(key)
+    if lease and lease[0] > 0:
+        lease[0] -= 1
+        return
+
+    # lease as many tokens as requests seen in current window (sparse requests take one at a time),
+    # small buckets are leased one token at a time, so one worker can't hold a big share of them
+    lease_size = max(1, min(Config.RATE_LIMIT_LEASE_SIZE, capacity // 4, requests[0]))
+    try:
+        granted, retry_after = await take_bucket_tokens(key, capacity, period, lease_size)
+    except RedisError as err:
+        logging.exception(err)
+        return  # fail open, redis outage shouldn't take login down
+
+    if not granted:
+        denied_buckets.set(key, time.monotonic() + retry_after, ttl=retry_after)
+        raise RateLimitExceededException(retry_after=retry_after)
+
+    if granted > 1:
+        leased_tokens.set(key, [granted - 1])
+
+
+class RateLimiter:
+    """
+    Token bucket limits of endpoint per client ip and per email from request body ('<requests>/<seconds>')
+    """
+    def __init__(self, name: str, per_ip: str, per_email: Optional[str] = None) -> None:
+        self.name = name
+        self.per_ip = parse_rate(per_ip)
+        self.per_email = parse_rate(per_email) if per_email else None
+
+    async def __call__(self, request: Request) -> None:
+        client_ip = request.client.host if request.client else 'unknown'
+        await take_rate_limit_token(f'{self.name}:ip:{client_ip}', *self.per_ip)
+
+        if self.per_email:
+            email = await self.request_email(request)
+            if email:
+                await take_rate_limit_token(f'{self.name}:email:{email}', *self.per_email)
+
+    @staticmethod
+    async def request_email(request: Request) -> Optional[str]:
+        # body was already read by FastAPI before dependencies run, request keeps it
+        try:
+            body = await request.json()
+        except ValueError:
+            return None
+
+        email = body.get('email') if isinstance(body, dict) else None
+        return email.strip().lower() if isinstance(email, str) else None
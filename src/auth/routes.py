@@ -4,13 +4,13 @@ from fastapi import APIRouter, Depends, status
 from fastapi.responses import JSONResponse
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.celery_tasks import send_email_task
 from src.config import Config
 from src.db.main import get_session
+from src.db.outbox import add_email_to_outbox, notify_outbox_relay
 from src.db.redis import add_jti_to_blocklist
 from src.errors import (UserAlreadyExistsException, InvalidCredentialsException,
                         InvalidTokenException, UserNotFoundException, PasswordsDoNotMatchException)
-from .dependencies import RefreshTokenBearer, AccessTokenBearer, get_current_user, RoleChecker
+from .dependencies import RefreshTokenBearer, access_token_bearer, get_current_user, RoleChecker, RateLimiter
 from .schemas import (UserBooks, UserCreateModel, UserLoginModel, EmailModel,
                       PasswordResetModel, PasswordResetConfirmModel)
 from .service import UserService
@@ -20,22 +20,28 @@ from .utils import (create_access_token, verify_password, REFRESH_TOKEN_EXPIRY,
 auth_router = APIRouter()
 user_service = UserService()
 role_checker = RoleChecker(['admin', 'user'])
+login_rate_limiter = RateLimiter('login', per_ip=Config.RATE_LIMIT_LOGIN_PER_IP,
+                                 per_email=Config.RATE_LIMIT_LOGIN_PER_EMAIL)
+signup_rate_limiter = RateLimiter('signup', per_ip=Config.RATE_LIMIT_SIGNUP_PER_IP)
+password_reset_rate_limiter = RateLimiter('password_reset', per_ip=Config.RATE_LIMIT_PASSWORD_RESET_PER_IP,
+                                          per_email=Config.RATE_LIMIT_PASSWORD_RESET_PER_EMAIL)
 
 
 @auth_router.post('/send_email')
-async def send_email(emails: EmailModel):
+async def send_email(emails: EmailModel, session: AsyncSession = Depends(get_session)):
     emails = emails.addresses
-    subject = 'Welcome to the app'
-    html_message = "<h1>Welcome to the BOOKLY</h1>"
 
-    # run celery task (runs on background, no need to wait in order to send response)
-    send_email_task.delay(emails, subject, html_message)
+    # sent on background by celery worker, no need to wait in order to send response
+    add_email_to_outbox(emails, 'welcome', {}, session)
+    await session.commit()
+    notify_outbox_relay()
 
     return {'message': 'Email was sent successfully'}
 
 
 @auth_router.post('/signup',
-                  status_code=status.HTTP_201_CREATED)
+                  status_code=status.HTTP_201_CREATED,
+                  dependencies=[Depends(signup_rate_limiter)])
 async def create_user_account(user_data: UserCreateModel,
                               session: AsyncSession = Depends(get_session)):
     """
@@ -46,19 +52,14 @@ async def create_user_account(user_data: UserCreateModel,
     if user_exists:
         raise UserAlreadyExistsException()
 
-    new_user = await user_service.create_user(user_data, session)
-
     # send email verification link that user needs to follow to set is_verified=True
     token = create_url_safe_token({'email': email})
     link = f'http://{Config.DOMAIN}/api/v1/auth/verify/{token}'
-    subject = 'Verify your email'
-    html_message = f"""
-    <h1> Verify your email </h1>
-    <p> Please click this <a href="{link}">link</a> to verify your email </p>
-    """
 
-    # run celery task (runs on background, no need to wait in order to send response)
-    send_email_task.delay([email], subject, html_message)
+    # email is committed together with user (rendered and sent on background by celery worker)
+    add_email_to_outbox([email], 'verify_email', {'link': link}, session)
+    new_user = await user_service.create_user(user_data, session)
+    notify_outbox_relay()
 
     return {
         'message': 'Account created. Please check email to verify your account.',
@@ -87,7 +88,7 @@ async def verify_user_account(token: str, session: AsyncSession = Depends(get_se
                         status_code=status.HTTP_200_OK)
 
 
-@auth_router.post('/login')
+@auth_router.post('/login', dependencies=[Depends(login_rate_limiter)])
 async def login_users(user_data: UserLoginModel,
                       session: AsyncSession = Depends(get_session)):
     """
@@ -99,7 +100,7 @@ async def login_users(user_data: UserLoginModel,
     if not user:
         raise InvalidCredentialsException()
 
-    password_valid = verify_password(password, user.password_hash)
+    password_valid = await verify_password(password, user.password_hash)
     if not password_valid:
         raise InvalidCredentialsException()
 
@@ -147,15 +148,17 @@ async def get_new_access_token(token_details: dict = Depends(RefreshTokenBearer(
 @auth_router.get('/me',
                  response_model=UserBooks,
                  dependencies=[Depends(role_checker)])
-async def get_current_user(user = Depends(get_current_user)):
+async def get_current_user(user = Depends(get_current_user),
+                           session: AsyncSession = Depends(get_session)):
     """
-    Get currently logged-in user details
+    Get currently logged-in user details (with books created by user)
     """
-    return user
+    # user is already loaded by get_current_user dependency (request loaders), so only its books are queried
+    return await user_service.load_user_books(user, session)
 
 
 @auth_router.post('/logout')
-async def revoke_token(token_data: dict = Depends(AccessTokenBearer())):
+async def revoke_token(token_data: dict = Depends(access_token_bearer)):
     """
     Logout existing user (blocklist current access token)
     """
@@ -169,8 +172,8 @@ async def revoke_token(token_data: dict = Depends(AccessTokenBearer())):
     )
 
 
-@auth_router.post('/password_reset')
-async def password_reset_request(email_data: PasswordResetModel):
+@auth_router.post('/password_reset', dependencies=[Depends(password_reset_rate_limiter)])
+async def password_reset_request(email_data: PasswordResetModel, session: AsyncSession = Depends(get_session)):
     """
     Reset password for requested email
     """
@@ -179,14 +182,11 @@ async def password_reset_request(email_data: PasswordResetModel):
     # send email with link to reset password
     token = create_url_safe_token({'email': email})
     link = f'http://{Config.DOMAIN}/api/v1/auth/confirm_password_reset/{token}'
-    subject = 'Reset password'
-    html_message = f"""
-    <h1> Reset password for your account </h1>
-    <p> Please click this <a href="{link}">link</a> to reset password </p>
-    """
 
-    # run celery task (runs on background, no need to wait in order to send response)
-    send_email_task.delay([email], subject, html_message)
+    # rendered and sent on background by celery worker, no need to wait in order to send response
+    add_email_to_outbox([email], 'password_reset', {'link': link}, session)
+    await session.commit()
+    notify_outbox_relay()
 
     return JSONResponse(
         content={'message': 'Password reset link sent. Please check your email to reset the password.'},
@@ -216,7 +216,7 @@ async def confirm_password_reset(token: str, password_data: PasswordResetConfirm
     if not user:
         raise UserNotFoundException()
 
-    new_hash = generate_password_hash(new_password)
+    new_hash = await generate_password_hash(new_password)
     await user_service.update_user(user, {'password_hash': new_hash}, session)
     return JSONResponse(content={'message': 'Password updated successfully!'},
                         status_code=status.HTTP_200_OK)
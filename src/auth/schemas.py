@@ -19,6 +19,16 @@ class User(BaseModel):
     update_date: datetime
 
 
+class UserPrincipal(BaseModel):
+    """
+    Slim projection of user used for auth checks (no relationships loaded)
+    """
+    uid: uuid.UUID
+    email: str
+    role: str
+    is_verified: bool
+
+
 class UserBooks(User):
     books: List[Book]  # return list of books created by user
 
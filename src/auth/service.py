@@ -1,10 +1,16 @@
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.db.models import User
-from .schemas import UserCreateModel
+from src.cache import TTLCache
+from src.config import Config
+from src.db.models import Book, User
+from .schemas import UserCreateModel, UserPrincipal
 from .utils import generate_password_hash
 
+# user_uid -> UserPrincipal, invalidated by UserService on user updates
+principal_cache = TTLCache(maxsize=Config.PRINCIPAL_CACHE_SIZE, ttl=Config.PRINCIPAL_CACHE_TTL)
+
 
 class UserService:
     async def get_user_by_email(self, email: str, session: AsyncSession):
@@ -13,6 +19,32 @@ class UserService:
         user = result.first()
         return user
 
+    async def load_user_books(self, user: User, session: AsyncSession) -> User:
+        """
+        Load books of already loaded user (only books are queried, not the user again)
+        """
+        result = await session.exec(select(Book).where(Book.user_uid == user.uid))
+        set_committed_value(user, 'books', list(result.all()))
+        return user
+
+    async def get_user_principal(self, user_uid: str, session: AsyncSession):
+        principal = principal_cache.get(str(user_uid))
+        if principal:
+            return principal
+
+        statement = select(User.uid, User.email, User.role, User.is_verified).where(User.uid == user_uid)
+        result = await session.exec(statement)
+        row = result.first()
+        if not row:
+            return None
+
+        principal = UserPrincipal.model_validate(row._mapping)
+        principal_cache.set(str(user_uid), principal)
+        return principal
+
+    def invalidate_user_principal(self, user_uid: str) -> None:
+        principal_cache.invalidate(str(user_uid))
+
     async def user_exists(self, email: str, session: AsyncSession):
         user = await self.get_user_by_email(email, session)
         return bool(user)
@@ -20,7 +52,7 @@ class UserService:
     async def create_user(self, user_data: UserCreateModel, session: AsyncSession):
         user_data_dict = user_data.model_dump()
         new_user = User(**user_data_dict)
-        new_user.password_hash = generate_password_hash(user_data_dict['password'])
+        new_user.password_hash = await generate_password_hash(user_data_dict['password'])
         new_user.role = 'user'
         session.add(new_user)
 
@@ -32,6 +64,7 @@ class UserService:
             setattr(user, k, v)
 
         await session.commit()
+        self.invalidate_user_principal(user.uid)  # role/verification could change
         return user
 
     async def delete_user(self):
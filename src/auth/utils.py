@@ -1,12 +1,19 @@
+import asyncio
+import hashlib
 import logging
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
 
 import jwt
 from itsdangerous import URLSafeTimedSerializer
 from passlib.context import CryptContext
 
+from src.cache import TTLCache
 from src.config import Config
+from src.errors import ServerBusyException
+from src.metrics import PASSWORD_HASH_CALLS, PASSWORD_HASH_DURATION, PASSWORD_HASH_POOL
 
 ACCESS_TOKEN_EXPIRY = 360  # seconds
 REFRESH_TOKEN_EXPIRY = 2  # days
@@ -16,13 +23,68 @@ password_context = CryptContext(
 )
 
 
-def generate_password_hash(password: str) -> str:
-    hash = password_context.hash(password)
+# bcrypt is slow on purpose and would block event loop, so it runs in own bounded pool
+# (bcrypt releases GIL, so threads hash in parallel)
+password_hash_executor = ThreadPoolExecutor(max_workers=Config.PASSWORD_HASH_WORKERS,
+                                            thread_name_prefix='password-hash')
+password_hash_counters = {'pending': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+
+
+def timed_password_hashing(operation: str, func, *args):
+    with PASSWORD_HASH_DURATION.labels(operation).time():  # time of hashing itself, without waiting in queue
+        return func(*args)
+
+
+async def run_password_hashing(operation: str, func, *args):
+    """
+    Run hashing function in password hash pool, reject call if pool queue is full
+    """
+    if password_hash_counters['pending'] >= Config.PASSWORD_HASH_WORKERS + Config.PASSWORD_HASH_MAX_QUEUE:
+        count_password_hash_call('rejected')
+        raise ServerBusyException()
+
+    password_hash_counters['pending'] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(password_hash_executor, timed_password_hashing, operation, func, *args)
+    except BaseException:
+        count_password_hash_call('failed')  # also cancelled ones
+        raise
+    finally:
+        password_hash_counters['pending'] -= 1
+
+    count_password_hash_call('completed')
+    return result
+
+
+def count_password_hash_call(result: str) -> None:
+    password_hash_counters[result] += 1
+    PASSWORD_HASH_CALLS.labels(result).inc()
+
+
+def get_password_hash_pool_stats() -> dict:
+    pending = password_hash_counters['pending']
+    return {
+        'workers': Config.PASSWORD_HASH_WORKERS,
+        'in_progress': min(pending, Config.PASSWORD_HASH_WORKERS),
+        'queued': max(pending - Config.PASSWORD_HASH_WORKERS, 0),
+        'completed': password_hash_counters['completed'],
+        'failed': password_hash_counters['failed'],
+        'rejected': password_hash_counters['rejected'],
+    }
+
+
+PASSWORD_HASH_POOL.labels('in_progress').set_function(lambda: get_password_hash_pool_stats()['in_progress'])
+PASSWORD_HASH_POOL.labels('queued').set_function(lambda: get_password_hash_pool_stats()['queued'])
+
+
+async def generate_password_hash(password: str) -> str:
+    hash = await run_password_hashing('hash', password_context.hash, password)
     return hash
 
 
-def verify_password(password: str, hash: str) -> bool:
-    match = password_context.verify(password, hash)
+async def verify_password(password: str, hash: str) -> bool:
+    match = await run_password_hashing('verify', password_context.verify, password, hash)
     return match
 
 
@@ -39,14 +101,27 @@ def create_access_token(user_data: dict, expiry: timedelta = None, refresh: bool
     return token
 
 
+# sha256(token) -> verified token claims, lets hot clients skip signature verification
+verified_token_cache = TTLCache(maxsize=Config.TOKEN_CACHE_SIZE, ttl=Config.TOKEN_CACHE_TTL)
+
+
 def decode_access_token(token: str) -> dict:
+    token_key = hashlib.sha256(token.encode()).digest()
+    token_data = verified_token_cache.get(token_key)
+    if token_data:
+        return token_data
+
     try:
         token_data = jwt.decode(jwt=token,
                                 key=Config.JWT_SECRET_KEY,
                                 algorithms=[Config.JWT_ALGORITHM])
-        return token_data
     except jwt.PyJWTError as err:
         logging.exception(err)
+        return None
+
+    # keep claims only while token is not expired (same clock as jwt exp validation)
+    verified_token_cache.set(token_key, token_data, ttl=token_data['exp'] - time.time())
+    return token_data
 
 
 # url_safe_token for email verification link
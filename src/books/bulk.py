@@ -0,0 +1,118 @@
+import csv
+import json
+from typing import AsyncIterator
+
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.config import Config
+from src.errors import ImportLineTooLongException
+from .schemas import BookCreateModel, BookImportResult
+from .service import BookService
+
+book_service = BookService()
+
+
+async def iter_lines(byte_stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Split streamed request body into lines without reading whole body into memory.
+    Lines over BULK_IMPORT_MAX_LINE_LENGTH bytes raise ImportLineTooLongException.
+    """
+    buffer = bytearray()
+    async for chunk in byte_stream:
+        buffer += chunk
+        end = buffer.rfind(b'\n')
+        if end != -1:
+            for line in buffer[:end].split(b'\n'):
+                yield decode_line(line)
+            del buffer[:end + 1]
+        if len(buffer) > Config.BULK_IMPORT_MAX_LINE_LENGTH:
+            raise ImportLineTooLongException()
+
+    if buffer:
+        yield decode_line(buffer)
+
+
+def decode_line(line: bytearray) -> str:
+    if len(line) > Config.BULK_IMPORT_MAX_LINE_LENGTH:
+        raise ImportLineTooLongException()
+    return line.decode('utf-8', errors='replace').rstrip('\r')
+
+
+async def iter_rows(lines: AsyncIterator[str], is_csv: bool) -> AsyncIterator[tuple[int, dict | None, list]]:
+    """
+    Yield (line number, parsed row, parsing errors) for every non-empty line.
+    CSV body needs header line with BookCreateModel field names, quoted values can't contain new lines.
+    """
+    header = None
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+
+        if is_csv:
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            if len(values) != len(header):
+                yield line_number, None, [{'msg': f'Expected {len(header)} values, got {len(values)}'}]
+                continue
+            yield line_number, dict(zip(header, values)), []
+        else:
+            try:
+                row = json.loads(line)
+            except ValueError as err:
+                yield line_number, None, [{'msg': f'Invalid JSON: {err}'}]
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, [{'msg': 'Expected JSON object'}]
+                continue
+            yield line_number, row, []
+
+
+async def import_books(byte_stream: AsyncIterator[bytes], is_csv: bool,
+                       user_uid: str, session: AsyncSession) -> BookImportResult:
+    """
+    Validate streamed rows against BookCreateModel and insert valid ones in chunks (commit per chunk).
+    Invalid rows and rows of failed chunks are reported, they don't stop the import.
+    """
+    result = BookImportResult()
+    chunk: list[tuple[int, dict]] = []
+
+    def add_error(line_number: int, errors: list):
+        result.failed += 1
+        if len(result.errors) < Config.BULK_IMPORT_MAX_ERRORS:
+            result.errors.append({'line': line_number, 'errors': errors})
+
+    async def insert_chunk():
+        try:
+            await book_service.bulk_create_books([row for _, row in chunk], user_uid, session)
+            result.inserted += len(chunk)
+        except SQLAlchemyError as err:
+            await session.rollback()
+            for line_number, _ in chunk:
+                add_error(line_number, [{'msg': f'Database error: {err.__class__.__name__}'}])
+        chunk.clear()
+
+    async for line_number, row, errors in iter_rows(iter_lines(byte_stream), is_csv):
+        if errors:
+            add_error(line_number, errors)
+            continue
+
+        try:
+            book_data = BookCreateModel.model_validate(row)
+        except ValidationError as err:
+            add_error(line_number, err.errors(include_url=False, include_context=False, include_input=False))
+            continue
+
+        chunk.append((line_number, book_data.model_dump()))
+        if len(chunk) >= Config.BULK_IMPORT_CHUNK_SIZE:
+            await insert_chunk()
+
+    if chunk:
+        await insert_chunk()
+
+    return result
@@ -1,45 +1,109 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, status
+from fastapi import APIRouter, Header, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
 from fastapi.params import Depends
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.auth.dependencies import AccessTokenBearer, RoleChecker
-from src.books.service import BookService
+from src.auth.dependencies import access_token_bearer, RoleChecker
+from src.books.bulk import import_books
+from src.books.service import BookService, BOOKS_CACHE_NAMESPACE, book_cache_key
+from src.config import Config
+from src.db.export import stream_ndjson
 from src.db.main import get_session
+from src.db.pagination import Page
+from src.db.redis import get_or_set_cached
 from src.errors import BookNotFoundException
-from .schemas import Book, BookDetailModel, BookUpdateModel, BookCreateModel
+from src.etags import conditional_response, make_etag, pack_cached_body
+from .schemas import Book, BookDetailModel, BookSearchPage, BookUpdateModel, BookCreateModel, BookImportResult
+from .schemas import BookBatchRequest, BookBatchResult
 
 book_router = APIRouter()
 book_service = BookService()
-access_token_bearer = AccessTokenBearer()
 role_checker = RoleChecker(['admin', 'user'])
 
 
 @book_router.get('/',
-                 response_model=List[Book],
+                 response_model=Page[Book],
                  dependencies=[Depends(access_token_bearer), Depends(role_checker)])
 async def get_all_books(
+        limit: int = Query(default=Config.PAGE_SIZE, ge=1, le=Config.MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        session: AsyncSession = Depends(get_session),
+):
+    """
+    Return page of books from db (newest first).
+    To get next page pass returned next_cursor as cursor param.
+    """
+    async def load_books():
+        books = await book_service.get_all_books(session, limit, cursor)
+        return Page[Book].model_validate(books, from_attributes=True).model_dump_json()
+
+    content = await get_or_set_cached(f'{limit}:{cursor}', Config.BOOK_LIST_CACHE_TTL, load_books,
+                                      namespace=BOOKS_CACHE_NAMESPACE)
+    return Response(content=content, media_type='application/json')
+
+
+@book_router.get('/top_rated',
+                 response_model=List[Book],
+                 dependencies=[Depends(access_token_bearer), Depends(role_checker)])
+async def get_top_rated_books(
+        limit: int = Query(default=Config.PAGE_SIZE, ge=1, le=Config.MAX_PAGE_SIZE),
+        min_reviews: int = Query(default=1, ge=1),
         session: AsyncSession = Depends(get_session),
 ):
     """
-    Return all books from db
+    Return books with the highest average rating (that have at least min_reviews reviews)
     """
-    books = await book_service.get_all_books(session)
+    books = await book_service.get_top_rated_books(limit, min_reviews, session)
     return books
 
 
+@book_router.get('/search',
+                 response_model=BookSearchPage,
+                 dependencies=[Depends(access_token_bearer), Depends(role_checker)])
+async def search_books(
+        q: Optional[str] = Query(default=None, max_length=200),
+        language: Optional[str] = None,
+        min_pages: Optional[int] = Query(default=None, ge=0),
+        max_pages: Optional[int] = Query(default=None, ge=0),
+        limit: int = Query(default=Config.PAGE_SIZE, ge=1, le=Config.MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        session: AsyncSession = Depends(get_session),
+):
+    """
+    Search books by words from title, author or publisher (q supports "quoted phrases", OR and -excluded words),
+    filter by language and page count. Best matches first, first page also returns language facet counts.
+    To get next page pass returned next_cursor as cursor param (with the same search params).
+    """
+    page = await book_service.search_books(session, limit, cursor, q, language, min_pages, max_pages)
+    return page
+
+
+@book_router.get('/export',
+                 response_class=StreamingResponse,
+                 dependencies=[Depends(access_token_bearer), Depends(role_checker)])
+async def export_books():
+    """
+    Stream all books from db as NDJSON (one book json per line)
+    """
+    return StreamingResponse(stream_ndjson(book_service.stream_books, Book),
+                             media_type='application/x-ndjson')
+
+
 @book_router.get('/user/{user_uid}',
-                 response_model=List[Book],
+                 response_model=Page[Book],
                  dependencies=[Depends(access_token_bearer), Depends(role_checker)])
 async def get_all_books_created_by_user(
         user_uid: str,
+        limit: int = Query(default=Config.PAGE_SIZE, ge=1, le=Config.MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
         session: AsyncSession = Depends(get_session),
 ):
     """
-    Return all books from db that are created by specific user
+    Return page of books from db that are created by specific user (newest first)
     """
-    books = await book_service.get_user_created_books(user_uid, session)
+    books = await book_service.get_user_created_books(user_uid, session, limit, cursor)
     return books
 
 
@@ -60,19 +124,65 @@ async def create_book(
     return new_book
 
 
+@book_router.post('/bulk',
+                  response_model=BookImportResult,
+                  dependencies=[Depends(role_checker)],
+                  openapi_extra={'requestBody': {'content': {
+                      'application/x-ndjson': {'schema': {'type': 'string'}},
+                      'text/csv': {'schema': {'type': 'string'}},
+                  }}})
+async def bulk_create_books(
+        request: Request,
+        session: AsyncSession = Depends(get_session),
+        token_details: dict = Depends(access_token_bearer),
+):
+    """
+    Create many books from streamed request body - NDJSON (one book json per line)
+    or CSV with header line (Content-Type: text/csv).
+    Invalid rows are skipped and returned in errors, valid rows are inserted in chunks.
+    """
+    user_uid = token_details['user']['user_uid']
+    is_csv = 'csv' in request.headers.get('content-type', '')
+    result = await import_books(request.stream(), is_csv, user_uid, session)
+    return result
+
+
+@book_router.post('/batch',
+                  response_model=BookBatchResult,
+                  dependencies=[Depends(access_token_bearer), Depends(role_checker)])
+async def get_books_batch(
+        batch: BookBatchRequest,
+        session: AsyncSession = Depends(get_session),
+):
+    """
+    Return many books by uids at once (up to BOOK_BATCH_MAX_SIZE), in order of requested uids.
+    Uids of books that don't exist are returned in missing.
+    """
+    books, missing = await book_service.get_books_by_uids(batch.uids, session)
+    return {'books': books, 'missing': missing}
+
+
 @book_router.get('/{book_uid}',
                  response_model=BookDetailModel,
                  dependencies=[Depends(access_token_bearer), Depends(role_checker)])
 async def get_book(
         book_uid: str,
+        request: Request,
         session: AsyncSession = Depends(get_session),
 ):
     """
-    Return book based on book uid
+    Return book based on book uid.
+    Supports conditional GET - returns 304 without body if If-None-Match / If-Modified-Since still match.
     """
-    book = await book_service.get_book(book_uid, session)
-    if book:
-        return book
+    async def load_book():
+        book = await book_service.get_book_with_reviews(book_uid, session)
+        if book:
+            body = BookDetailModel.model_validate(book, from_attributes=True).model_dump_json()
+            return pack_cached_body(make_etag(book.uid, book.update_date), book.update_date, body)
+
+    content = await get_or_set_cached(book_cache_key(book_uid), Config.BOOK_CACHE_TTL, load_book)
+    if content:
+        return conditional_response(request, content)
 
     raise BookNotFoundException()
 
@@ -82,13 +192,17 @@ async def get_book(
 async def update_book(
         book_uid: str,
         update_data: BookUpdateModel,
+        response: Response,
+        if_match: Optional[str] = Header(default=None),
         session: AsyncSession = Depends(get_session),
 ):
     """
-    Update book with new data
+    Update book with new data.
+    If If-Match header is provided, book is updated only if its ETag still matches (412 otherwise).
     """
-    updated_book = await book_service.update_book(book_uid, update_data, session)
+    updated_book = await book_service.update_book(book_uid, update_data, session, if_match)
     if updated_book:
+        response.headers['ETag'] = make_etag(updated_book.uid, updated_book.update_date)
         return updated_book
 
     raise BookNotFoundException()
@@ -1,8 +1,20 @@
 import uuid
 from datetime import datetime
-from typing import List
+from typing import Dict, List, Optional
+from src.config import Config
+from src.db.pagination import Page
 from src.reviews.schemas import Review
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+
+class BookRating(BaseModel):
+    review_count: int
+    rating_avg: float
+    rating_1: int
+    rating_2: int
+    rating_3: int
+    rating_4: int
+    rating_5: int
 
 
 class Book(BaseModel):
@@ -14,12 +26,27 @@ class Book(BaseModel):
     language: str
     create_date: datetime
     update_date: datetime
+    rating: Optional[BookRating] = None  # None if book has no reviews yet
 
 
 class BookDetailModel(Book):
     reviews: List[Review]
 
 
+class BookSearchPage(Page[Book]):
+    # number of matching books per facet value ({'language': {'English': 10}}), returned on first page only
+    facets: Optional[Dict[str, Dict[str, int]]] = None
+
+
+class BookBatchRequest(BaseModel):
+    uids: List[uuid.UUID] = Field(min_length=1, max_length=Config.BOOK_BATCH_MAX_SIZE)
+
+
+class BookBatchResult(BaseModel):
+    books: List[Book]  # in order of requested uids
+    missing: List[uuid.UUID]  # requested uids that don't exist
+
+
 class BookCreateModel(BaseModel):
     title: str
     author: str
@@ -34,3 +61,9 @@ class BookUpdateModel(BaseModel):
     publisher: str
     page_count: int
     language: str
+
+
+class BookImportResult(BaseModel):
+    inserted: int = 0
+    failed: int = 0
+    errors: List[dict] = []  # line number + errors of first BULK_IMPORT_MAX_ERRORS failed rows
@@ -1,54 +1,222 @@
-from sqlmodel import select, desc
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Float, any_, bindparam, cast, func
+import sqlalchemy.dialects.postgresql as pg
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import contains_eager, selectinload
+from sqlmodel import select, insert, update, delete
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.db.models import Book
+from src.config import Config
+from src.db.models import Book, BookRating, Review, BOOK_SEARCH_CONFIG, book_search_vector
+from src.db.pagination import paginate_by_create_date, paginate_by_rank, build_page, build_rank_page
+from src.db.redis import invalidate_cached
+from src.errors import PreconditionFailedException
+from src.etags import CACHED_BODY_VERSION, etag_versions
 from .schemas import BookCreateModel, BookUpdateModel
 
+BOOKS_CACHE_NAMESPACE = 'books'  # cached book listings
+REVIEWS_CACHE_NAMESPACE = 'reviews'  # cached review listings
+
+
+def book_cache_key(book_uid: str) -> str:
+    return f'book:v{CACHED_BODY_VERSION}:{str(book_uid).lower()}'
+
+
+def review_cache_key(review_uid: str) -> str:
+    # here and not in reviews, since deleting book changes its reviews
+    return f'review:v{CACHED_BODY_VERSION}:{str(review_uid).lower()}'
+
 
 class BookService:
-    async def get_all_books(self, session: AsyncSession):
-        statement = select(Book).order_by(desc(Book.create_date))
+    async def get_all_books(self, session: AsyncSession, limit: int, cursor: Optional[str] = None):
+        statement = paginate_by_create_date(select(Book), Book, limit, cursor)
         result = await session.exec(statement)
-        return result.all()
+        return build_page(result.all(), limit)
+
+    async def stream_books(self, session: AsyncSession):
+        # server-side cursor, yields batches of books, so memory doesn't grow with table size
+        # (rating is joined into the same query, as in other book endpoints)
+        statement = (select(Book)
+                     .outerjoin(BookRating)
+                     .options(contains_eager(Book.rating))
+                     .execution_options(yield_per=Config.EXPORT_BATCH_SIZE))
+        result = await session.stream(statement)
+        async for books in result.scalars().partitions():
+            yield books
 
-    async def get_user_created_books(self, user_uid: str, session: AsyncSession):
-        statement = select(Book).where(Book.user_uid == user_uid).order_by(desc(Book.create_date))
+    async def get_user_created_books(self, user_uid: str, session: AsyncSession,
+                                     limit: int, cursor: Optional[str] = None):
+        statement = paginate_by_create_date(select(Book).where(Book.user_uid == user_uid), Book, limit, cursor)
+        result = await session.exec(statement)
+        return build_page(result.all(), limit)
+
+    async def get_top_rated_books(self, limit: int, min_reviews: int, session: AsyncSession):
+        statement = (select(Book)
+                     .join(BookRating)
+                     .options(contains_eager(Book.rating))
+                     .where(BookRating.review_count >= min_reviews)
+                     .order_by(BookRating.rating_avg.desc(), BookRating.review_count.desc())
+                     .limit(limit))
         result = await session.exec(statement)
         return result.all()
 
+    async def search_books(self, session: AsyncSession, limit: int, cursor: Optional[str] = None,
+                           q: Optional[str] = None, language: Optional[str] = None,
+                           min_pages: Optional[int] = None, max_pages: Optional[int] = None):
+        """
+        Full-text search in title (highest weight), author and publisher, ordered by rank (newest first without q).
+        Language facet counts ignore language filter, so client can see counts of other languages.
+        """
+        filters = []
+        if q:
+            query = func.websearch_to_tsquery(BOOK_SEARCH_CONFIG, q)
+            filters.append(book_search_vector.bool_op('@@')(query))
+        if min_pages is not None:
+            filters.append(Book.page_count >= min_pages)
+        if max_pages is not None:
+            filters.append(Book.page_count <= max_pages)
+        language_filters = [Book.language == language] if language else []
+
+        if q:
+            rank = func.ts_rank_cd(book_search_vector, query)
+            statement = paginate_by_rank(select(Book, rank).where(*filters, *language_filters), Book, rank,
+                                         limit, cursor)
+            result = await session.exec(statement)
+            page = build_rank_page(result.all(), limit)
+        else:
+            statement = paginate_by_create_date(select(Book).where(*filters, *language_filters), Book, limit, cursor)
+            result = await session.exec(statement)
+            page = build_page(result.all(), limit)
+
+        if not cursor:
+            statement = (select(Book.language, func.count())
+                         .where(*filters)
+                         .group_by(Book.language)
+                         .order_by(func.count().desc()))
+            result = await session.exec(statement)
+            page['facets'] = {'language': dict(result.all())}
+        return page
+
     async def get_book(self, book_uid: str, session: AsyncSession):
         statement = select(Book).where(Book.uid == book_uid)
         result = await session.exec(statement)
         book = result.first()
         return None or book
 
+    async def get_books_by_uids(self, book_uids: list[uuid.UUID], session: AsyncSession):
+        """
+        Return (books in order of book_uids, missing uids) - fetched by one query.
+        uids are sent as one array param, so statement is the same (and prepared once) for any number of them.
+        """
+        book_uids = list(dict.fromkeys(book_uids))  # drop duplicates, keep order
+        uids_param = bindparam('book_uids', book_uids, type_=pg.ARRAY(pg.UUID))
+        statement = select(Book).where(Book.uid == any_(uids_param))
+        result = await session.exec(statement)
+        books = {book.uid: book for book in result.all()}
+
+        found = [books[uid] for uid in book_uids if uid in books]
+        missing = [uid for uid in book_uids if uid not in books]
+        return found, missing
+
+    async def get_book_with_reviews(self, book_uid: str, session: AsyncSession):
+        statement = select(Book).where(Book.uid == book_uid).options(selectinload(Book.reviews))
+        result = await session.exec(statement)
+        book = result.first()
+        return None or book
+
     async def create_book(self, book_data: BookCreateModel, user_uid: str, session: AsyncSession):
         book_data_dict = book_data.model_dump()
         new_book = Book(**book_data_dict)
         new_book.user_uid = user_uid
+        new_book.rating = None  # new book has no reviews, response would otherwise lazy load it
         session.add(new_book)
 
         await session.commit()
+        await invalidate_cached(namespaces=(BOOKS_CACHE_NAMESPACE,))
         return new_book
 
-    async def update_book(self, book_uid: str, upd_data: BookUpdateModel, session: AsyncSession):
-        book_to_update = await self.get_book(book_uid, session)
-        if not book_to_update:
-            return None
+    async def bulk_create_books(self, books_data: list[dict], user_uid: str, session: AsyncSession):
+        # executemany, sqlalchemy sends it as batched multi-row INSERT statements
+        rows = [{**book_data, 'user_uid': user_uid} for book_data in books_data]
+        await session.exec(insert(Book), params=rows)
+
+        await session.commit()
+        await invalidate_cached(namespaces=(BOOKS_CACHE_NAMESPACE,))
+        return len(rows)
+
+    def add_rating_statement(self, book_uid: uuid.UUID, rating: int):
+        """
+        Statement adding review rating to book aggregates (run it in the same transaction as review insert)
+        """
+        rating_column = f'rating_{rating}'
+        statement = pg_insert(BookRating).values(book_uid=book_uid, review_count=1, rating_sum=rating,
+                                                 rating_avg=rating, **{rating_column: 1})
+        return statement.on_conflict_do_update(
+            index_elements=[BookRating.book_uid],
+            set_={
+                'review_count': BookRating.review_count + 1,
+                'rating_sum': BookRating.rating_sum + rating,
+                'rating_avg': cast(BookRating.rating_sum + rating, Float) / (BookRating.review_count + 1),
+                rating_column: getattr(BookRating, rating_column) + 1,
+            },
+        )
 
-        upd_data_dict = upd_data.model_dump()
-        for k, v in upd_data_dict.items():
-            setattr(book_to_update, k, v)  # todo - handle update_date + create_date during update
+    def touch_book_statement(self, book_uid: uuid.UUID):
+        """
+        Statement changing update_date of book when its reviews change, book details include them
+        """
+        return update(Book).where(Book.uid == book_uid).values(update_date=datetime.now())
+
+    async def update_book(self, book_uid: str, upd_data: BookUpdateModel, session: AsyncSession,
+                          if_match: Optional[str] = None):
+        """
+        Update book in one UPDATE ... RETURNING statement.
+        With If-Match, row is updated only if it's still the version from etag (412 otherwise).
+        """
+        statement = (update(Book)
+                     .where(Book.uid == book_uid)
+                     .values(**upd_data.model_dump(), update_date=datetime.now())
+                     .returning(Book))
+        if if_match and if_match.strip() != '*':
+            # etag of other book never matches, even if it has the same update_date
+            update_dates = [update_date for uid, update_date in etag_versions(if_match)
+                            if str(uid) == str(book_uid).lower()]
+            statement = statement.where(Book.update_date.in_(update_dates))
+
+        result = await session.exec(statement)
+        updated_book = result.scalars().first()
+        if not updated_book:
+            if if_match and await self.get_book(book_uid, session):
+                raise PreconditionFailedException()
+            return None
 
         await session.commit()
-        return book_to_update
+        await invalidate_cached(book_cache_key(book_uid), namespaces=(BOOKS_CACHE_NAMESPACE,))
+        return updated_book
 
     async def delete_book(self, book_uid: str, session: AsyncSession):
-        book_to_delete = await self.get_book(book_uid, session)
-        if not book_to_delete:
+        """
+        Delete book in one DELETE ... RETURNING statement.
+        Reviews of the book are kept without book (same as ORM delete did), rating is deleted by db cascade.
+        """
+        orphaned_reviews = (update(Review)
+                            .where(Review.book_uid == book_uid)
+                            .values(book_uid=None, update_date=datetime.now())  # new etag, body has changed
+                            .returning(Review.uid)
+                            .cte('orphaned_reviews'))
+        orphaned_review_uids = select(func.array_agg(orphaned_reviews.c.uid)).scalar_subquery()
+        statement = delete(Book).where(Book.uid == book_uid).returning(Book.uid, orphaned_review_uids)
+        result = await session.exec(statement)
+        deleted = result.first()
+        if not deleted:
             return None
 
-        await session.delete(book_to_delete)
         await session.commit()
+        review_keys = [review_cache_key(review_uid) for review_uid in deleted[1] or []]
+        await invalidate_cached(book_cache_key(book_uid), *review_keys,
+                               namespaces=(BOOKS_CACHE_NAMESPACE, REVIEWS_CACHE_NAMESPACE))
 
         return True
@@ -1,22 +1,111 @@
-from celery import Celery
-from src.mail import mail, create_message
+import asyncio
+import logging
 from typing import List
-from asgiref.sync import async_to_sync
 
-# celery tasks are synchronous! so need to convert async to sync
+import aiosmtplib
+from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
+from jinja2 import TemplateError
+from src.mail import SMTPMailer, create_message, email_config, load_email_templates, render_email
+
+# celery tasks are synchronous! so async code runs in event loop of worker process
 celery_app = Celery()
 celery_app.config_from_object('src.config')
 
+# created lazily, so every forked worker process gets its own loop and smtp connection
+worker_loop = None
+mailer = SMTPMailer(email_config)
+# failures of smtp session rather than of one message, sending stops on them (other errors only skip the message)
+SMTP_CONNECTION_ERRORS = (OSError, aiosmtplib.SMTPAuthenticationError, aiosmtplib.SMTPHeloError,
+                          aiosmtplib.SMTPNotSupported)
+# errors that sending again later may fix (connection errors and temporary 4xx replies)
+SMTP_RETRYABLE_ERRORS = (OSError, aiosmtplib.SMTPException)
+
+
+def run_in_worker_loop(coroutine):
+    """
+    Run coroutine in event loop kept for the whole life of worker process
+    (smtp connection opened in it can be reused by next tasks)
+    """
+    global worker_loop
+    if worker_loop is None or worker_loop.is_closed():
+        worker_loop = asyncio.new_event_loop()
+    return worker_loop.run_until_complete(coroutine)
+
+
+@worker_process_init.connect
+def compile_email_templates(**kwargs):
+    load_email_templates()
+
+
+@worker_process_shutdown.connect
+def close_worker_loop(**kwargs):
+    if worker_loop is not None and not worker_loop.is_closed():
+        worker_loop.run_until_complete(mailer.close())
+        worker_loop.close()
+
+
+def build_email_message(email: dict):
+    """
+    Build message from {'recipients', 'template_id', 'params'} or (tasks queued before templates)
+    {'recipients', 'subject', 'body'}
+    """
+    if 'template_id' in email:
+        subject, body = render_email(email['template_id'], email['params'])
+    else:
+        subject, body = email['subject'], email['body']
+    return create_message(recipients=email['recipients'], subject=subject, body=body)
+
+
+def is_permanent_smtp_error(err: aiosmtplib.SMTPException) -> bool:
+    """
+    Is error a permanent (5xx) server reply, sending message again wouldn't help
+    """
+    if isinstance(err, aiosmtplib.SMTPRecipientsRefused):
+        return all(recipient.code >= 500 for recipient in err.recipients)
+    return isinstance(err, aiosmtplib.SMTPResponseException) and err.code >= 500
+
+
+async def send_emails(emails: List[dict]) -> None:
+    """
+    Send emails over one smtp connection, email has either template_id + params or subject + body.
+    Emails rejected by server for good (5xx) are logged and skipped, connection and temporary (4xx) errors
+    stop sending.
+    """
+    for email in emails:
+        try:
+            message = build_email_message(email)
+        except (KeyError, ValueError, TemplateError) as err:
+            # e.g. unknown template, sending it again wouldn't help
+            logging.error(f'Email to {email.get("recipients")} skipped, it can\'t be built: {err!r}')
+            continue
+
+        try:
+            await mailer.send_message(message)
+        except SMTP_CONNECTION_ERRORS:
+            raise
+        except aiosmtplib.SMTPException as err:
+            if not is_permanent_smtp_error(err):  # e.g. mailbox busy, greylisting
+                raise
+            logging.error(f'Email to {email["recipients"]} rejected: {err}')  # e.g. no such user
+
 
 @celery_app.task()
 def send_email_task(recipients: List[str], subject: str, body: str):
     """
     Send email task
     """
-    message = create_message(
-        recipients=recipients,
-        subject=subject,
-        body=body
-    )
+    run_in_worker_loop(send_emails([{'recipients': recipients, 'subject': subject, 'body': body}]))
 
-    async_to_sync(mail.send_message)(message)
+
+@celery_app.task(bind=True, max_retries=5, default_retry_delay=30)
+def send_email_batch_task(self, emails: List[dict]):
+    """
+    Send many emails ({'recipients': [...], 'template_id': ..., 'params': {...}}) over one smtp connection.
+    If smtp is unavailable or defers email, task is retried with emails that were not sent yet.
+    """
+    for index, email in enumerate(emails):
+        try:
+            run_in_worker_loop(send_emails([email]))
+        except SMTP_RETRYABLE_ERRORS as err:
+            raise self.retry(exc=err, args=[emails[index:]])
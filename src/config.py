@@ -3,9 +3,19 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    DB_ECHO: bool = False  # log every sql statement, for debugging only
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30  # seconds to wait for free connection
+    DB_POOL_RECYCLE: int = 1800  # seconds
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT: int = 30000  # ms
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 500
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str
     REDIS_URL: str = "redis://localhost:6379/0"
+    # how often local copy of token blocklist is synced with redis (max delay of logout on other workers)
+    BLOCKLIST_REFRESH_INTERVAL: float = 5  # seconds
 
     MAIL_USERNAME: str
     MAIL_PASSWORD: str
@@ -18,6 +28,61 @@ class Settings(BaseSettings):
     USE_CREDENTIALS: bool = True
     VALIDATE_CERTS: bool = True
     DOMAIN: str
+    # emails are written to outbox table and relayed to celery in batches (sent over one smtp connection)
+    EMAIL_BATCH_SIZE: int = 50  # emails per relayed batch
+    OUTBOX_RELAY_INTERVAL: float = 5.0  # seconds, how often outbox is checked for emails added by other processes
+
+    # json access log, written by background thread
+    ACCESS_LOG_SUCCESS_SAMPLE_RATE: float = 1.0  # share of logged requests with status < 400, errors are always logged
+    ACCESS_LOG_QUEUE_SIZE: int = 10000  # records waiting to be written, new ones are dropped when full
+
+    # pagination of list endpoints
+    PAGE_SIZE: int = 20
+    MAX_PAGE_SIZE: int = 100
+    BOOK_BATCH_MAX_SIZE: int = 100  # uids per POST /books/batch request
+
+    # bulk import of books
+    BULK_IMPORT_CHUNK_SIZE: int = 1000  # rows per insert + commit
+    BULK_IMPORT_MAX_ERRORS: int = 1000  # row errors returned in response
+    BULK_IMPORT_MAX_LINE_LENGTH: int = 65536  # bytes, longer line stops import with 413
+    EXPORT_BATCH_SIZE: int = 1000  # rows fetched from db cursor at once during export
+
+    # redis response cache ttl, seconds
+    BOOK_CACHE_TTL: int = 300
+    BOOK_LIST_CACHE_TTL: int = 30
+    REVIEW_CACHE_TTL: int = 300
+
+    # in-process cache of user role/verification used by auth checks (0 ttl disables it)
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL: int = 60  # seconds
+
+    # in-process cache of verified jwt claims, entries never outlive token exp (0 ttl disables it)
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_TTL: int = 300  # seconds
+
+    # bcrypt runs in dedicated thread pool, requests over workers + queue size get 503
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+
+    # token bucket limits of auth endpoints doing bcrypt / sending emails, '<requests>/<seconds>'
+    RATE_LIMIT_LOGIN_PER_IP: str = '20/60'
+    RATE_LIMIT_LOGIN_PER_EMAIL: str = '5/60'
+    RATE_LIMIT_SIGNUP_PER_IP: str = '5/600'
+    RATE_LIMIT_PASSWORD_RESET_PER_IP: str = '5/600'
+    RATE_LIMIT_PASSWORD_RESET_PER_EMAIL: str = '3/600'
+    RATE_LIMIT_LEASE_SIZE: int = 5  # max tokens taken from redis at once and spent locally
+    RATE_LIMIT_LEASE_TTL: float = 1.0  # seconds, unspent leased tokens are dropped after it
+    RATE_LIMIT_CACHE_SIZE: int = 10000  # buckets with local leases / known to be empty
+
+    # admission control, max concurrent requests per route group (see admission_route_groups in middleware),
+    # requests over limit wait in queue of the group, requests over queue size or wait timeout get 503
+    ADMISSION_AUTH_LIMIT: int = 8
+    ADMISSION_BOOKS_LIMIT: int = 16
+    ADMISSION_REVIEWS_LIMIT: int = 8
+    ADMISSION_STREAMS_LIMIT: int = 4  # export / bulk import
+    ADMISSION_LIGHT_LIMIT: int = 32  # token refresh / logout, don't use db
+    ADMISSION_QUEUE_SIZE: int = 64  # per group
+    ADMISSION_QUEUE_TIMEOUT: float = 2.0  # seconds
 
     # location of the env config file
     model_config = SettingsConfigDict(
@@ -0,0 +1,15 @@
+from typing import AsyncIterator, Callable
+
+from pydantic import BaseModel
+
+from .main import async_session_maker
+
+
+async def stream_ndjson(stream_rows: Callable, schema: type[BaseModel]) -> AsyncIterator[str]:
+    """
+    Serialize rows / models streamed by service method as NDJSON (one json object per line).
+    Uses own session, since request dependencies are closed before streaming response body is sent.
+    """
+    async with async_session_maker() as session:
+        async for rows in stream_rows(session):
+            yield ''.join(schema.model_validate(row, from_attributes=True).model_dump_json() + '\n' for row in rows)
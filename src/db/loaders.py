@@ -0,0 +1,70 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from fastapi import Depends
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.db.main import get_session
+from src.db.models import User
+
+
+class DataLoader:
+    """
+    Coalesce load(key) calls made during the same event loop tick into one batch_load(keys) call.
+    Results are memoised, so every key is loaded only once per loader (use one loader per request).
+    """
+    def __init__(self, batch_load: Callable[[list], Awaitable[dict]], lock: asyncio.Lock) -> None:
+        self.batch_load = batch_load  # returns {key: value}, keys that are not found are missing
+        self.lock = lock  # loaders share request session, that can't run queries concurrently
+        self.results: dict[Hashable, asyncio.Future] = {}
+        self.queue: list[Hashable] = []
+        self.tasks: set[asyncio.Task] = set()  # running batches, referenced so they are not garbage collected
+
+    async def load(self, key: Hashable) -> Any:
+        if key not in self.results:
+            loop = asyncio.get_running_loop()
+            self.results[key] = loop.create_future()
+            self.queue.append(key)
+            if len(self.queue) == 1:
+                loop.call_soon(self._dispatch)  # after other tasks had chance to queue their keys
+
+        return await self.results[key]
+
+    def _dispatch(self) -> None:
+        keys, self.queue = self.queue, []
+        task = asyncio.create_task(self._load_batch(keys))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _load_batch(self, keys: list[Hashable]) -> None:
+        try:
+            async with self.lock:
+                values = await self.batch_load(keys)
+        except Exception as err:
+            for key in keys:
+                self.results.pop(key).set_exception(err)  # not memoised, so next load retries
+            return
+
+        for key in keys:
+            self.results[key].set_result(values.get(key))
+
+
+class Loaders:
+    """
+    Request scoped loaders of rows by key (None for keys that don't exist).
+    Add loader here only for lookups that several dependencies / services of one request make.
+    """
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+        lock = asyncio.Lock()
+        self.users_by_email = DataLoader(self._load_users_by_email, lock)
+
+    async def _load_users_by_email(self, emails: list[str]) -> dict:
+        result = await self.session.exec(select(User).where(User.email.in_(emails)))
+        return {user.email: user for user in result.all()}
+
+
+async def get_loaders(session: AsyncSession = Depends(get_session)) -> Loaders:
+    # FastAPI caches dependencies per request, so all dependencies of request get the same loaders & session
+    return Loaders(session)
@@ -1,17 +1,31 @@
-from sqlalchemy.ext.asyncio import AsyncEngine
-from sqlalchemy.orm import sessionmaker
-from sqlmodel import create_engine, SQLModel
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.config import Config
 
-async_engine = AsyncEngine(
-    create_engine(
-        url=Config.DATABASE_URL,
-        echo=True,
-    )
+async_engine = create_async_engine(
+    url=Config.DATABASE_URL,
+    echo=Config.DB_ECHO,
+    pool_size=Config.DB_POOL_SIZE,
+    max_overflow=Config.DB_MAX_OVERFLOW,
+    pool_timeout=Config.DB_POOL_TIMEOUT,
+    pool_recycle=Config.DB_POOL_RECYCLE,
+    pool_pre_ping=Config.DB_POOL_PRE_PING,
+    connect_args={
+        'prepared_statement_cache_size': Config.DB_PREPARED_STATEMENT_CACHE_SIZE,
+        'server_settings': {'statement_timeout': str(Config.DB_STATEMENT_TIMEOUT)},  # ms
+    },
 )
 
+# created once, building sessionmaker per request is wasted work
+async_session_maker = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+)
+
+
 async def init_db():
     async with async_engine.begin() as conn:
         # statement = text("SELECT 'hello';")  # to check connection
@@ -19,16 +33,21 @@ async def init_db():
         # result = await conn.execute(statement)
         # print(result.all())
 
-        # create tables for all SQLModels (see sql executed in server logs)
+        # create tables for all SQLModels (set DB_ECHO=True to see sql executed in server logs)
         await conn.run_sync(SQLModel.metadata.create_all)
 
 
 async def get_session() -> AsyncSession:
-    Session = sessionmaker(
-        bind=async_engine,
-        class_=AsyncSession,
-        expire_on_commit=False,
-    )
-
-    async with Session() as session:
+    async with async_session_maker() as session:
         yield session
+
+
+def get_pool_stats() -> dict:
+    pool = async_engine.pool
+    return {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        'max_overflow': Config.DB_MAX_OVERFLOW,
+    }
@@ -3,6 +3,7 @@ from datetime import datetime
 from typing import List, Optional
 
 import sqlalchemy.dialects.postgresql as pg
+from sqlalchemy import ForeignKey, Index, func, text
 from sqlmodel import SQLModel, Field, Column, Relationship
 
 
@@ -13,7 +14,7 @@ class User(SQLModel, table=True):
                                             primary_key=True,
                                             default=uuid.uuid4))
     username: str
-    email: str
+    email: str = Field(unique=True, index=True)  # user is looked up by email on login
     first_name: str
     last_name: str
     role: str = Field(sa_column=Column(pg.VARCHAR, nullable=False, server_default='user'))
@@ -22,8 +23,9 @@ class User(SQLModel, table=True):
     create_date: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
     update_date: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
     # to link to books & reviews, to return all books & reviews created by the user
-    books: List['Book'] = Relationship(back_populates='user', sa_relationship_kwargs={'lazy': 'selectin'})
-    reviews: List['Review'] = Relationship(back_populates='user', sa_relationship_kwargs={'lazy': 'selectin'})
+    # (not loaded by default, use selectinload() option in queries that need them)
+    books: List['Book'] = Relationship(back_populates='user')
+    reviews: List['Review'] = Relationship(back_populates='user')
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -45,22 +47,50 @@ class Book(SQLModel, table=True):
     user_uid: Optional[uuid.UUID] = Field(default=None, foreign_key='users.uid')
     # to link books to users & reviews (for user call, where we can see all books created by this user)
     user: Optional['User'] = Relationship(back_populates='books')
-    reviews: List['Review'] = Relationship(back_populates='book', sa_relationship_kwargs={'lazy': 'selectin'})
+    reviews: List['Review'] = Relationship(back_populates='book')  # not loaded by default, same as User.books
+    # precomputed review stats, cheap to load with every book (one row per book)
+    rating: Optional['BookRating'] = Relationship(sa_relationship_kwargs={'lazy': 'joined',
+                                                                          'uselist': False,
+                                                                          'cascade': 'all, delete-orphan',
+                                                                          'passive_deletes': True})
 
     def __repr__(self):
         return f'<Book {self.title}>'
 
 
+class BookRating(SQLModel, table=True):
+    """
+    Review aggregates of a book, updated in the same transaction as review is added
+    """
+    __tablename__ = 'book_ratings'
+    book_uid: uuid.UUID = Field(sa_column=Column(pg.UUID,
+                                                 ForeignKey('books.uid', ondelete='CASCADE'),
+                                                 nullable=False,
+                                                 primary_key=True))
+    review_count: int = Field(default=0)
+    rating_sum: int = Field(default=0)
+    rating_avg: float = Field(default=0)
+    # histogram - number of reviews per rating value
+    rating_1: int = Field(default=0)
+    rating_2: int = Field(default=0)
+    rating_3: int = Field(default=0)
+    rating_4: int = Field(default=0)
+    rating_5: int = Field(default=0)
+
+    def __repr__(self):
+        return f'<BookRating {self.rating_avg} from {self.review_count} reviews for book {self.book_uid}>'
+
+
 class Review(SQLModel, table=True):
     __tablename__ = 'reviews'
     uid: uuid.UUID = Field(sa_column=Column(pg.UUID,
                                             nullable=False,
                                             primary_key=True,
                                             default=uuid.uuid4))
-    rating: int = Field(lt=5)
+    rating: int = Field(ge=1, le=5)
     review_text: str
     user_uid: Optional[uuid.UUID] = Field(default=None, foreign_key='users.uid')
-    book_uid: Optional[uuid.UUID] = Field(default=None, foreign_key='books.uid')
+    book_uid: Optional[uuid.UUID] = Field(default=None, foreign_key='books.uid', index=True)
     create_date: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
     update_date: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
     user: Optional['User'] = Relationship(back_populates='reviews')
@@ -68,3 +98,44 @@ class Review(SQLModel, table=True):
 
     def __repr__(self):
         return f'<Review {self.rating} stars for book {self.book_uid} by user {self.user_uid}>'
+
+
+class EmailOutbox(SQLModel, table=True):
+    """
+    Email waiting to be sent, written in the same transaction as data it's about (see src/db/outbox.py)
+    """
+    __tablename__ = 'email_outbox'
+    id: Optional[int] = Field(default=None, primary_key=True)  # increasing, emails are relayed in this order
+    recipients: List[str] = Field(sa_column=Column(pg.JSONB, nullable=False))
+    template_id: str  # see EMAIL_TEMPLATES in src/mail.py, html is rendered by celery worker
+    params: dict = Field(sa_column=Column(pg.JSONB, nullable=False))
+    create_date: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.template_id} to {self.recipients}>'
+
+
+# indexes matching keyset pagination order (create_date DESC, uid DESC) of list endpoints
+Index('ix_books_create_date_uid', Book.create_date.desc(), Book.uid.desc())
+Index('ix_books_user_uid_create_date_uid', Book.user_uid, Book.create_date.desc(), Book.uid.desc())
+Index('ix_reviews_create_date_uid', Review.create_date.desc(), Review.uid.desc())
+Index('ix_reviews_user_uid_create_date_uid', Review.user_uid, Review.create_date.desc(), Review.uid.desc())
+# for top rated books
+Index('ix_book_ratings_rating_avg_review_count', BookRating.rating_avg.desc(), BookRating.review_count.desc())
+
+
+# full-text search document of a book, matched by GIN expression index (queries have to use the same expression)
+BOOK_SEARCH_CONFIG = text("'simple'::regconfig")  # no stemming, titles and names are in many languages
+
+
+def _weighted_search_vector(column, weight: str):
+    return func.setweight(func.to_tsvector(BOOK_SEARCH_CONFIG, column), text(f"'{weight}'"),
+                          type_=pg.TSVECTOR)
+
+
+book_search_vector = (_weighted_search_vector(Book.title, 'A')
+                      .op('||', return_type=pg.TSVECTOR)(_weighted_search_vector(Book.author, 'B'))
+                      .op('||', return_type=pg.TSVECTOR)(_weighted_search_vector(Book.publisher, 'C')))
+Index('ix_books_search', book_search_vector, postgresql_using='gin')
+# search filters
+Index('ix_books_language_page_count', Book.language, Book.page_count)
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+
+from sqlmodel import delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.celery_tasks import send_email_batch_task
+from src.config import Config
+from src.db.main import async_session_maker
+from src.db.models import EmailOutbox
+
+# set after commit of outbox emails, so relay in this process doesn't wait for next poll
+outbox_wakeup = asyncio.Event()
+
+
+def add_email_to_outbox(recipients: list[str], template_id: str, params: dict, session: AsyncSession) -> None:
+    """
+    Add email to outbox (doesn't commit, email is sent only if caller's transaction commits)
+    """
+    session.add(EmailOutbox(recipients=recipients, template_id=template_id, params=params))
+
+
+def notify_outbox_relay() -> None:
+    outbox_wakeup.set()
+
+
+async def relay_outbox_emails(session: AsyncSession) -> int:
+    """
+    Move one batch of emails from outbox to celery, return number of relayed emails.
+    Rows locked by relays of other processes are skipped. If publish fails, delete is rolled back
+    (email can be published twice if commit fails after publish, never lost).
+    """
+    batch = (select(EmailOutbox.id)
+             .order_by(EmailOutbox.id)
+             .limit(Config.EMAIL_BATCH_SIZE)
+             .with_for_update(skip_locked=True)
+             .scalar_subquery())
+    statement = (delete(EmailOutbox)
+                 .where(EmailOutbox.id.in_(batch))
+                 .returning(EmailOutbox.recipients, EmailOutbox.template_id, EmailOutbox.params))
+    try:
+        result = await session.exec(statement)
+        emails = [dict(row._mapping) for row in result.all()]
+        if emails:
+            # broker publish is blocking network call, keep it off event loop
+            await asyncio.to_thread(send_email_batch_task.delay, emails)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    return len(emails)
+
+
+async def run_outbox_relay() -> None:
+    """
+    Relay outbox emails to celery (started on app startup).
+    Wakes up on notify_outbox_relay() or every OUTBOX_RELAY_INTERVAL seconds (emails added by other processes).
+    """
+    while True:
+        outbox_wakeup.clear()
+        try:
+            async with async_session_maker() as session:
+                while await relay_outbox_emails(session) == Config.EMAIL_BATCH_SIZE:
+                    pass
+        except Exception as err:
+            logging.exception(err)
+
+        try:
+            await asyncio.wait_for(outbox_wakeup.wait(), timeout=Config.OUTBOX_RELAY_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
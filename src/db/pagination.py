@@ -0,0 +1,106 @@
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+from typing import Generic, List, Optional, TypeVar
+
+from pydantic import BaseModel
+from sqlmodel import desc, tuple_
+
+from src.errors import InvalidCursorException
+
+T = TypeVar('T')
+
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None  # pass it as `cursor` param to get the next page, None on last page
+
+
+def encode_cursor(values: dict) -> str:
+    """
+    Encode keyset values of the last returned row into opaque url-safe cursor
+    """
+    raw = json.dumps(values, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    Decode cursor created by encode_cursor (raise InvalidCursorException for malformed ones)
+    """
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise InvalidCursorException()
+
+    if not isinstance(values, dict):
+        raise InvalidCursorException()
+    return values
+
+
+def decode_create_date_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    values = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(values['create_date']), uuid.UUID(values['uid'])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidCursorException()
+
+
+def decode_rank_cursor(cursor: str) -> tuple[float, uuid.UUID]:
+    values = decode_cursor(cursor)
+    try:
+        return float(values['rank']), uuid.UUID(values['uid'])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidCursorException()
+
+
+def paginate_by_create_date(statement, model, limit: int, cursor: Optional[str] = None):
+    """
+    Apply keyset pagination on (create_date, uid) - newest first.
+    Fetches limit + 1 rows, so caller can tell if there is a next page (see build_page).
+    Unlike OFFSET, cost of the query does not depend on how deep the page is.
+    """
+    if cursor:
+        create_date, uid = decode_create_date_cursor(cursor)
+        statement = statement.where(tuple_(model.create_date, model.uid) < tuple_(create_date, uid))
+
+    return statement.order_by(desc(model.create_date), desc(model.uid)).limit(limit + 1)
+
+
+def build_page(rows: list, limit: int) -> dict:
+    """
+    Build page from rows fetched by paginate_by_create_date.
+    Returned as dict, so response_model=Page[...] reads items from attributes (incl. loaded relationships).
+    """
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor({'create_date': last.create_date.isoformat(), 'uid': str(last.uid)})
+
+    return {'items': items, 'next_cursor': next_cursor}
+
+
+def paginate_by_rank(statement, model, rank, limit: int, cursor: Optional[str] = None):
+    """
+    Apply keyset pagination on (rank, uid) - best match first.
+    Statement has to select (model, rank), rows are turned into page by build_rank_page.
+    """
+    if cursor:
+        rank_value, uid = decode_rank_cursor(cursor)
+        statement = statement.where(tuple_(rank, model.uid) < tuple_(rank_value, uid))
+
+    return statement.order_by(desc(rank), desc(model.uid)).limit(limit + 1)
+
+
+def build_rank_page(rows: list, limit: int) -> dict:
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last, rank = items[-1]
+        next_cursor = encode_cursor({'rank': rank, 'uid': str(last.uid)})
+
+    return {'items': [item for item, _ in items], 'next_cursor': next_cursor}
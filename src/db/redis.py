@@ -1,18 +1,206 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from typing import Optional
+
 import redis.asyncio as aioredis
+from redis.exceptions import RedisError
 from src.config import Config
+from src.metrics import REDIS_COMMAND_DURATION
 
 JTI_EXPIRY = 3600  # seconds
+BLOCKLIST_RECENT_KEY = 'token_blocklist:recent'  # sorted set of revoked jti -> revoke timestamp
+BLOCKLIST_FILTER_CAPACITY = 10000
+BLOCKLIST_FILTER_ERROR_RATE = 0.001
 token_blocklist = aioredis.from_url(Config.REDIS_URL)
 
 
+class BloomFilter:
+    """
+    Set membership filter without false negatives, with error_rate chance of false positive
+    """
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))  # bits
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+# local copy of recently revoked jti, rebuilt from redis every BLOCKLIST_REFRESH_INTERVAL seconds
+blocklist_filter: Optional[BloomFilter] = None
+blocklist_filter_refreshed_at = 0.0
+
+
 async def add_jti_to_blocklist(jti: str) -> None:
-    await token_blocklist.set(
-        name=jti,
-        value='',
-        ex=JTI_EXPIRY,
-    )
+    with REDIS_COMMAND_DURATION.labels('blocklist_add').time():
+        async with token_blocklist.pipeline(transaction=True) as pipe:
+            pipe.set(name=jti, value='', ex=JTI_EXPIRY)
+            pipe.zadd(BLOCKLIST_RECENT_KEY, {jti: time.time()})
+            await pipe.execute()
+
+    if blocklist_filter is not None:
+        blocklist_filter.add(jti)  # other workers will see it after their next refresh
 
 
 async def token_in_blocklist(jti: str) -> bool:
-    jti = await token_blocklist.get(jti)
-    return bool(jti)
+    # almost no tokens are revoked, so skip redis call if local filter is fresh and says jti is not there
+    filter_age = time.monotonic() - blocklist_filter_refreshed_at
+    if blocklist_filter is not None and filter_age < 3 * Config.BLOCKLIST_REFRESH_INTERVAL:
+        if jti not in blocklist_filter:
+            return False
+
+    # value stored for jti is empty, so check key existence rather than value
+    with REDIS_COMMAND_DURATION.labels('blocklist_get').time():
+        return await token_blocklist.exists(jti) > 0
+
+
+async def refresh_blocklist_filter() -> None:
+    """
+    Rebuild local blocklist filter from jti revoked during last JTI_EXPIRY seconds
+    """
+    global blocklist_filter, blocklist_filter_refreshed_at
+
+    with REDIS_COMMAND_DURATION.labels('blocklist_refresh').time():
+        async with token_blocklist.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(BLOCKLIST_RECENT_KEY, '-inf', time.time() - JTI_EXPIRY)
+            pipe.zrange(BLOCKLIST_RECENT_KEY, 0, -1)
+            _, revoked_jtis = await pipe.execute()
+
+    new_filter = BloomFilter(capacity=max(BLOCKLIST_FILTER_CAPACITY, 2 * len(revoked_jtis)),
+                             error_rate=BLOCKLIST_FILTER_ERROR_RATE)
+    for jti in revoked_jtis:
+        new_filter.add(jti.decode())
+
+    blocklist_filter = new_filter
+    blocklist_filter_refreshed_at = time.monotonic()
+
+
+async def run_blocklist_filter_refresh() -> None:
+    """
+    Keep local blocklist filter in sync with redis (started on app startup).
+    If refresh keeps failing, filter gets stale and token_in_blocklist falls back to redis.
+    """
+    while True:
+        try:
+            await refresh_blocklist_filter()
+        except Exception as err:
+            logging.exception(err)
+
+        await asyncio.sleep(Config.BLOCKLIST_REFRESH_INTERVAL)
+
+
+# response cache, values are serialized json bytes.
+# Every key / namespace has version bumped by invalidate_cached and values are stored under current version,
+# so value built from db before invalidation (but stored after it) is never read.
+CACHE_KEY_PREFIX = 'cache:'
+CACHE_VERSION_TTL = 86400  # seconds, longer than any cache ttl, so versions aren't reset while values live
+CACHE_GET_SCRIPT = """
+local version = redis.call('GET', KEYS[1]) or '0'
+return {version, redis.call('GET', ARGV[1] .. version)}
+"""
+cache_get_script = token_blocklist.register_script(CACHE_GET_SCRIPT)
+
+
+def cache_version_key(name: str) -> str:
+    # name is cache key or namespace
+    return f'{CACHE_KEY_PREFIX}{name}:version'
+
+
+async def get_or_set_cached(key: str, ttl: int, build, namespace: Optional[str] = None) -> Optional[bytes]:
+    """
+    Return cached value or cache value returned by async build() (None results are not cached).
+    Keys in namespace are dropped all at once by invalidate_cached(namespaces=...), use it for listings.
+    Redis errors are logged and treated as cache miss.
+    """
+    value_key = f'{CACHE_KEY_PREFIX}{namespace}:{key}:v' if namespace else f'{CACHE_KEY_PREFIX}{key}:v'
+    try:
+        with REDIS_COMMAND_DURATION.labels('cache_get').time():
+            version, value = await cache_get_script(keys=[cache_version_key(namespace or key)], args=[value_key])
+    except RedisError as err:
+        logging.exception(err)
+        return await build()  # don't cache, current version is unknown
+
+    if value is not None:
+        return value
+
+    value = await build()
+    if value is not None:
+        try:
+            with REDIS_COMMAND_DURATION.labels('cache_set').time():
+                await token_blocklist.set(value_key + version.decode(), value, ex=ttl)
+        except RedisError as err:
+            logging.exception(err)
+    return value
+
+
+async def invalidate_cached(*keys: str, namespaces: tuple[str, ...] = ()) -> None:
+    """
+    Bump version of keys and namespaces (values cached with old version are not used anymore and expire)
+    """
+    try:
+        with REDIS_COMMAND_DURATION.labels('cache_invalidate').time():
+            async with token_blocklist.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.incr(cache_version_key(key))
+                    pipe.expire(cache_version_key(key), CACHE_VERSION_TTL)
+                for namespace in namespaces:
+                    pipe.incr(cache_version_key(namespace))
+                await pipe.execute()
+    except RedisError as err:
+        logging.exception(err)
+
+
+# token buckets of rate limits, refilled continuously up to capacity (time is taken from redis,
+# so all workers agree on it). Returns tokens granted (up to requested) and ms until next token if none was.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_per_ms = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill_per_ms)
+
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / refill_per_ms))
+
+local retry_after = 0
+if granted == 0 then
+    retry_after = math.ceil((1 - tokens) / refill_per_ms)
+end
+return {granted, retry_after}
+"""
+RATE_LIMIT_KEY_PREFIX = 'rate_limit:'
+token_bucket_script = token_blocklist.register_script(TOKEN_BUCKET_SCRIPT)
+
+
+async def take_bucket_tokens(key: str, capacity: int, period: float, requested: int) -> tuple[int, float]:
+    """
+    Atomically take up to requested tokens from bucket that allows capacity requests per period seconds.
+    Return number of granted tokens and seconds until bucket has a token again (0 if some were granted).
+    """
+    with REDIS_COMMAND_DURATION.labels('rate_limit').time():
+        granted, retry_after_ms = await token_bucket_script(
+            keys=[RATE_LIMIT_KEY_PREFIX + key],
+            args=[capacity, capacity / (period * 1000), requested],
+        )
+    return int(granted), int(retry_after_ms) / 1000
@@ -1,3 +1,4 @@
+import math
 from typing import Any
 
 from fastapi import FastAPI, status
@@ -60,6 +61,28 @@ class ReviewNotFoundException(BooklyException):
     pass
 
 
+class InvalidCursorException(BooklyException):
+    pass
+
+
+class ServerBusyException(BooklyException):
+    pass
+
+
+class PreconditionFailedException(BooklyException):
+    pass
+
+
+class ImportLineTooLongException(BooklyException):
+    pass
+
+
+class RateLimitExceededException(BooklyException):
+    def __init__(self, retry_after: float) -> None:
+        super().__init__()
+        self.retry_after = max(1, math.ceil(retry_after))  # seconds
+
+
 def create_exception_handler(status_code: int, init_detail: Any):
 
     async def exception_handler(request: Request, exc: Exception):
@@ -68,6 +91,15 @@ def create_exception_handler(status_code: int, init_detail: Any):
     return exception_handler
 
 
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceededException):
+    return JSONResponse(
+        content={'message': 'Too many requests',
+                 'resolution': f'Please try again in {exc.retry_after} seconds'},
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={'Retry-After': str(exc.retry_after)},
+    )
+
+
 def register_all_errors(app: FastAPI):
     app.add_exception_handler(
         InvalidCredentialsException, create_exception_handler(
@@ -142,6 +174,35 @@ def register_all_errors(app: FastAPI):
             init_detail={'message': 'Review not found'}
         )
     )
+    app.add_exception_handler(
+        InvalidCursorException, create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            init_detail={'message': 'Invalid pagination cursor',
+                         'resolution': 'Please use next_cursor value returned by previous page'}
+        )
+    )
+    app.add_exception_handler(
+        ServerBusyException, create_exception_handler(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            init_detail={'message': 'Server is busy',
+                         'resolution': 'Please try again later'}
+        )
+    )
+    app.add_exception_handler(
+        PreconditionFailedException, create_exception_handler(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            init_detail={'message': 'Resource was modified',
+                         'resolution': 'Please get current version and send its ETag in If-Match header'}
+        )
+    )
+    app.add_exception_handler(
+        ImportLineTooLongException, create_exception_handler(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            init_detail={'message': 'Import line is too long',
+                         'resolution': 'Please put every book on its own line'}
+        )
+    )
+    app.add_exception_handler(RateLimitExceededException, rate_limit_exceeded_handler)
 
     @app.exception_handler(500)
     async def internal_server_error(request, exception):
@@ -0,0 +1,96 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, status
+from fastapi.responses import Response
+
+
+EPOCH = datetime(1970, 1, 1)
+# part of cache keys of packed bodies, bump it whenever packed format or etag format changes
+# (entries cached by previous version are then not read)
+CACHED_BODY_VERSION = 3  # 3: reversible etags with update date
+
+
+def make_etag(uid, update_date: datetime) -> str:
+    """
+    Strong ETag of resource, changes every time update_date of resource changes.
+    uid and update_date can be read back from it (see etag_versions), so If-Match can be checked in UPDATE statement.
+    """
+    microseconds = (update_date - EPOCH) // timedelta(microseconds=1)
+    return f'"{uuid.UUID(str(uid)).hex}-{microseconds:x}"'
+
+
+def etag_versions(header: str) -> list[tuple[uuid.UUID, datetime]]:
+    """
+    Return (uid, update date) of etags from If-Match header value.
+    If-Match uses strong comparison, so weak etags (W/...) never match and are skipped, same as unknown ones.
+    """
+    versions = []
+    for value in header.split(','):
+        value = value.strip()
+        if value.startswith('W/'):
+            continue
+        try:
+            uid, microseconds = value.strip('"').split('-')
+            versions.append((uuid.UUID(uid), EPOCH + timedelta(microseconds=int(microseconds, 16))))
+        except (ValueError, OverflowError):
+            continue
+    return versions
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """
+    Check if If-Match / If-None-Match header value ('*' or list of etags) matches etag
+    """
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return etag in (value.strip().removeprefix('W/') for value in header.split(','))
+
+
+def http_date(value: datetime) -> str:
+    # dates in db are naive local time
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def pack_cached_body(etag: str, update_date: datetime, body: str) -> bytes:
+    """
+    Store etag and update date together with cached json body, so conditional GET doesn't need db
+    """
+    return f'{etag}\t{update_date.isoformat()}\n{body}'.encode()
+
+
+def conditional_response(request: Request, cached_body: bytes) -> Response:
+    """
+    Return 304 without body if client has current version of resource (If-None-Match / If-Modified-Since),
+    full json response otherwise
+    """
+    meta, body = cached_body.split(b'\n', 1)
+    etag, update_date = meta.decode().split('\t')
+    update_date = datetime.fromisoformat(update_date)
+    headers = {'ETag': etag, 'Last-Modified': http_date(update_date)}
+
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        not_modified = etag_matches(if_none_match, etag)
+    else:
+        not_modified = not_modified_since(request.headers.get('if-modified-since'), update_date)
+
+    if not_modified:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+
+def not_modified_since(header: Optional[str], update_date: datetime) -> bool:
+    if not header:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return update_date.astimezone(timezone.utc).replace(microsecond=0) <= since
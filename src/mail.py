@@ -1,6 +1,14 @@
+import logging
+from email.utils import formataddr
+from pathlib import Path
+from typing import Optional
+
+import aiosmtplib
 from fastapi_mail import FastMail, ConnectionConfig, MessageSchema, MessageType
+from fastapi_mail.msg import MailMsg
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
 from src.config import Config
-from pathlib import Path
 
 # get the parent directory
 BASE_DIR = Path(__file__).resolve().parent
@@ -21,8 +29,91 @@ email_config = ConnectionConfig(
 
 mail = FastMail(config=email_config)
 
+# template id -> (subject, template file), API only sends template id + params, html is rendered by celery worker
+EMAIL_TEMPLATES = {
+    'welcome': ('Welcome to the app', 'welcome.html'),
+    'verify_email': ('Verify your email', 'verify_email.html'),
+    'password_reset': ('Reset password', 'password_reset.html'),
+}
+# outbox rows written before templates, params hold already rendered subject + body
+PRERENDERED_TEMPLATE_ID = 'prerendered'
+# compiled templates are kept in environment cache, files are not checked for changes
+email_template_env = Environment(loader=FileSystemLoader(Path(BASE_DIR, 'templates')),
+                                 autoescape=select_autoescape(), auto_reload=False)
+
+
+def load_email_templates() -> None:
+    """
+    Compile all email templates (on worker start, so first emails don't pay for it)
+    """
+    for _, template_file in EMAIL_TEMPLATES.values():
+        email_template_env.get_template(template_file)
+
+
+def render_email(template_id: str, params: dict) -> tuple[str, str]:
+    """
+    Return subject and html body of email
+    """
+    if template_id == PRERENDERED_TEMPLATE_ID:
+        return params['subject'], params['body']
+    subject, template_file = EMAIL_TEMPLATES[template_id]
+    return subject, email_template_env.get_template(template_file).render(**params)
+
+
 def create_message(recipients: list[str], subject: str, body: str):
     message = MessageSchema(
         recipients=recipients, subject=subject, body=body, subtype=MessageType.html
     )
     return message
+
+
+class SMTPMailer:
+    """
+    Send messages over one SMTP connection kept open between calls (fastapi-mail connects + logs in per message).
+    Connection is reopened if server closed it. Not thread safe, use one per worker process and event loop.
+    """
+    def __init__(self, config: ConnectionConfig) -> None:
+        self.config = config
+        self.smtp: Optional[aiosmtplib.SMTP] = None
+
+    async def connect(self) -> aiosmtplib.SMTP:
+        if self.smtp is None or not self.smtp.is_connected:
+            self.smtp = None
+            smtp = aiosmtplib.SMTP(hostname=self.config.MAIL_SERVER,
+                                   port=self.config.MAIL_PORT,
+                                   timeout=self.config.TIMEOUT,
+                                   use_tls=self.config.MAIL_SSL_TLS,
+                                   start_tls=self.config.MAIL_STARTTLS,
+                                   validate_certs=self.config.VALIDATE_CERTS)
+            try:
+                await smtp.connect()
+                if self.config.USE_CREDENTIALS:
+                    await smtp.login(self.config.MAIL_USERNAME, self.config.MAIL_PASSWORD.get_secret_value())
+            except BaseException:
+                smtp.close()  # kept only once logged in, so failed login is retried on next send
+                raise
+            self.smtp = smtp
+        return self.smtp
+
+    async def send_message(self, message: MessageSchema) -> None:
+        sender = self.config.MAIL_FROM
+        if self.config.MAIL_FROM_NAME is not None:
+            sender = formataddr((self.config.MAIL_FROM_NAME, self.config.MAIL_FROM))
+        mime_message = await MailMsg(message)._message(sender)
+        if self.config.SUPPRESS_SEND:
+            return
+
+        try:
+            await (await self.connect()).send_message(mime_message)
+        except aiosmtplib.SMTPServerDisconnected:
+            # idle connection was closed by server, retry once on new one
+            self.smtp = None
+            await (await self.connect()).send_message(mime_message)
+
+    async def close(self) -> None:
+        if self.smtp is not None and self.smtp.is_connected:
+            try:
+                await self.smtp.quit()
+            except aiosmtplib.SMTPException as err:
+                logging.exception(err)
+        self.smtp = None
@@ -0,0 +1,87 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from celery.signals import after_task_publish, before_task_publish
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+
+from src.db.main import async_engine, get_pool_stats
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Request duration until response start',
+                             ['method', 'route', 'status'])
+DB_QUERY_DURATION = Histogram('db_query_duration_seconds', 'Duration of db statements', ['operation'],
+                              buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+DB_QUERIES_PER_REQUEST = Histogram('db_queries_per_request', 'Number of db statements executed by request',
+                                   ['route'], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100))
+REDIS_COMMAND_DURATION = Histogram('redis_command_duration_seconds', 'Duration of redis calls', ['command'],
+                                   buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, 1))
+PASSWORD_HASH_DURATION = Histogram('password_hash_duration_seconds', 'Duration of bcrypt hash / verify',
+                                   ['operation'], buckets=(.05, .1, .2, .3, .5, .75, 1, 2, 5))
+PASSWORD_HASH_POOL = Gauge('password_hash_pool_calls', 'Calls running / queued in bcrypt thread pool', ['state'])
+PASSWORD_HASH_CALLS = Counter('password_hash_calls_total', 'Finished bcrypt calls', ['result'])
+CELERY_PUBLISH_DURATION = Histogram('celery_task_publish_duration_seconds', 'Time to send task to broker',
+                                    ['task'], buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 5))
+ADMISSION_REJECTED = Counter('admission_rejected_requests_total', 'Requests rejected by admission control',
+                             ['group', 'reason'])
+ADMISSION_WAIT_DURATION = Histogram('admission_wait_duration_seconds', 'Time request waited in admission queue',
+                                    ['group'], buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2, 5))
+DB_POOL_CONNECTIONS = Gauge('db_pool_connections', 'Connections of db pool', ['state'])
+DB_POOL_CONNECTIONS.labels('checked_out').set_function(lambda: get_pool_stats()['checked_out'])
+DB_POOL_CONNECTIONS.labels('checked_in').set_function(lambda: get_pool_stats()['checked_in'])
+DB_POOL_CONNECTIONS.labels('overflow').set_function(lambda: get_pool_stats()['overflow'])
+
+UNMATCHED_ROUTE = '<unmatched>'  # raw paths would make label cardinality unbounded
+
+# number of db statements of current request (list, so event handlers can update value set by middleware)
+db_queries_in_request: ContextVar[Optional[list]] = ContextVar('db_queries_in_request', default=None)
+
+
+def start_request_metrics() -> None:
+    db_queries_in_request.set([0])
+
+
+def observe_request(method: str, route: Optional[str], status_code: int, duration_ns: int) -> None:
+    route = route or UNMATCHED_ROUTE
+    REQUEST_DURATION.labels(method, route, status_code).observe(duration_ns / 1e9)
+    db_queries = db_queries_in_request.get()
+    if db_queries is not None:
+        DB_QUERIES_PER_REQUEST.labels(route).observe(db_queries[0])
+
+
+@event.listens_for(async_engine.sync_engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+@event.listens_for(async_engine.sync_engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start_time'].pop()
+    DB_QUERY_DURATION.labels(statement.split(None, 1)[0].upper()).observe(duration)
+    db_queries = db_queries_in_request.get()
+    if db_queries is not None:
+        db_queries[0] += 1
+
+
+@event.listens_for(async_engine.sync_engine, 'handle_error')
+def _handle_error(context):
+    # failed statement doesn't get after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_start_time'):
+        context.connection.info['query_start_time'].pop()
+
+
+# publish runs synchronously in caller's thread, so start of current publish is kept in context
+_task_publish_start: ContextVar[Optional[float]] = ContextVar('task_publish_start', default=None)
+
+
+@before_task_publish.connect
+def _before_task_publish(sender=None, **kwargs):
+    _task_publish_start.set(time.perf_counter())
+
+
+@after_task_publish.connect
+def _after_task_publish(sender=None, **kwargs):
+    start = _task_publish_start.get()
+    if start is not None:
+        CELERY_PUBLISH_DURATION.labels(sender).observe(time.perf_counter() - start)
+        _task_publish_start.set(None)
@@ -1,30 +1,225 @@
+import asyncio
+import json
 import logging
+import math
+import queue
+import random
+import sys
 import time
+from collections import deque
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.config import Config
+from src.metrics import ADMISSION_REJECTED, ADMISSION_WAIT_DURATION, observe_request, start_request_metrics
 
 logger = logging.getLogger('uvicorn.access')
 logger.disabled = True
 
 
-def register_middleware(app: FastAPI):
+class AccessLogHandler(QueueHandler):
+    """
+    Pass records to listener thread as they are (formatting and writing happens there).
+    Records are dropped if queue is full, request never waits for logging.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(), **record.msg})
+
+
+access_log_queue = queue.Queue(maxsize=Config.ACCESS_LOG_QUEUE_SIZE)
+access_logger = logging.getLogger('bookly.access')
+access_logger.propagate = False
+access_logger.setLevel(logging.INFO)
+access_logger.addHandler(AccessLogHandler(access_log_queue))
+
+access_log_stream_handler = logging.StreamHandler(sys.stdout)
+access_log_stream_handler.setFormatter(JsonFormatter())
+# started and stopped with the app (see life_span)
+access_log_listener = QueueListener(access_log_queue, access_log_stream_handler)
+
+
+def log_request(request: Request, status_code: int, duration_ns: int) -> None:
+    """
+    Record request metrics and log request as json line
+    (successful ones only with ACCESS_LOG_SUCCESS_SAMPLE_RATE probability)
+    """
+    route = request.scope.get('route')
+    route_path = route.path if route else None  # route template, e.g. /api/v1/books/{book_uid}
+    observe_request(request.method, route_path, status_code, duration_ns)
+
+    sample_rate = Config.ACCESS_LOG_SUCCESS_SAMPLE_RATE if status_code < 400 else 1.0
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+
+    access_logger.info({
+        'method': request.method,
+        'path': route_path or request.url.path,
+        'status': status_code,
+        'duration_ms': round(duration_ns / 1_000_000, 3),
+        'sample_rate': sample_rate,
+    })
+
+
+class AdmissionGroup:
+    """
+    Concurrency limit of route group with bounded FIFO queue of requests waiting for a slot
+    """
+    def __init__(self, name: str, limit: int, queue_size: int) -> None:
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self, timeout: float) -> bool:
+        """
+        Take slot, waiting at most timeout seconds. Return False if queue is full or wait timed out.
+        """
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return True
+
+        if len(self.waiters) >= self.queue_size:
+            ADMISSION_REJECTED.labels(self.name, 'queue_full').inc()
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait([future], timeout=timeout)
+        except asyncio.CancelledError:
+            if not self._abandon(future):
+                self.release()  # slot was handed over right before client went away
+            raise
+        finally:
+            ADMISSION_WAIT_DURATION.labels(self.name).observe(time.perf_counter() - start_time)
+
+        if self._abandon(future):
+            ADMISSION_REJECTED.labels(self.name, 'timeout').inc()
+            return False
+        return True
+
+    def release(self) -> None:
+        if self.waiters:
+            self.waiters.popleft().set_result(None)  # slot goes to first waiter, active count stays
+        else:
+            self.active -= 1
+
+    def _abandon(self, future: asyncio.Future) -> bool:
+        # stop waiting, False if slot was already handed to the waiter
+        if future.done():
+            return False
+        future.cancel()
+        self.waiters.remove(future)
+        return True
+
+
+def admission_route_groups(api_prefix: str) -> tuple[tuple[str, str], ...]:
+    """
+    Return (path prefix, group) pairs, first matching prefix decides group of request.
+    Paths of no group are not limited (docs, metrics).
+    """
+    return (
+        (f'{api_prefix}/auth/refresh_access_token', 'light'),
+        (f'{api_prefix}/auth/logout', 'light'),
+        (f'{api_prefix}/auth', 'auth'),
+        # streamed export / import keep slot for their whole duration, so they don't take slots of listings
+        (f'{api_prefix}/books/export', 'streams'),
+        (f'{api_prefix}/books/bulk', 'streams'),
+        (f'{api_prefix}/reviews/export', 'streams'),
+        (f'{api_prefix}/books', 'books'),
+        (f'{api_prefix}/reviews', 'reviews'),
+    )
+
+
+class AdmissionControlMiddleware:
+    """
+    Limit concurrent requests per route group, so slow db doesn't make requests of all routes pile up.
+    Requests of saturated group wait in its queue, 503 is returned right away when queue is full.
+    """
+    def __init__(self, app: ASGIApp, route_groups: tuple[tuple[str, str], ...], limits: dict[str, int],
+                 queue_size: int, queue_timeout: float) -> None:
+        self.app = app
+        self.route_groups = route_groups
+        self.groups = {name: AdmissionGroup(name, limit, queue_size) for name, limit in limits.items()}
+        self.queue_timeout = queue_timeout
+
+    def route_group(self, path: str) -> AdmissionGroup | None:
+        for prefix, name in self.route_groups:
+            if path.startswith(prefix):
+                return self.groups.get(name)
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        group = self.route_group(scope['path']) if scope['type'] == 'http' else None
+        if group is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await group.acquire(self.queue_timeout):
+            response = JSONResponse(
+                content={'message': 'Server is busy', 'resolution': 'Please try again later'},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(math.ceil(self.queue_timeout))},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)  # streamed responses keep slot until they are sent
+        finally:
+            group.release()
+
+
+def register_middleware(app: FastAPI, api_prefix: str):
+
+    # added first, so it runs inside of logging middleware and rejected requests are logged too
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        route_groups=admission_route_groups(api_prefix),
+        limits={
+            'auth': Config.ADMISSION_AUTH_LIMIT,
+            'books': Config.ADMISSION_BOOKS_LIMIT,
+            'reviews': Config.ADMISSION_REVIEWS_LIMIT,
+            'streams': Config.ADMISSION_STREAMS_LIMIT,
+            'light': Config.ADMISSION_LIGHT_LIMIT,
+        },
+        queue_size=Config.ADMISSION_QUEUE_SIZE,
+        queue_timeout=Config.ADMISSION_QUEUE_TIMEOUT,
+    )
 
     @app.middleware('http')
     async def custom_logging(request: Request, call_next):
         """
         Provide custom logging
         """
-        start_time = time.time()
-
-        response = await call_next(request)
-
-        processed_time = time.time() - start_time
-        message = f'{request.method} - {request.url.path} - {response.status_code} - completed in {processed_time} s'
-        print(message)
+        start_time = time.perf_counter_ns()
+        start_request_metrics()
+        try:
+            response = await call_next(request)
+        except Exception:
+            log_request(request, status.HTTP_500_INTERNAL_SERVER_ERROR, time.perf_counter_ns() - start_time)
+            raise
 
+        log_request(request, response.status_code, time.perf_counter_ns() - start_time)
         return response
 
     # commenting, since it blocks new user from signing up (they have no auth yet)
@@ -1,55 +1,75 @@
-from typing import List
+from typing import Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.auth.dependencies import AccessTokenBearer, RoleChecker
-from src.auth.dependencies import get_current_user
+from src.auth.dependencies import access_token_bearer, RoleChecker
+from src.config import Config
+from src.db.export import stream_ndjson
 from src.db.main import get_session
-from src.db.models import User
+from src.db.pagination import Page
+from src.db.redis import get_or_set_cached
 from src.errors import ReviewNotFoundException
+from src.etags import conditional_response, make_etag, pack_cached_body
 from .schemas import Review, ReviewCreateModel
-from .service import ReviewService
+from .service import ReviewService, review_cache_key
 
 review_router = APIRouter()
 review_service = ReviewService()
-access_token_bearer = AccessTokenBearer()
 role_checker = RoleChecker(['admin', 'user'])
 
 
 @review_router.get('/',
-                   response_model=List[Review],
+                   response_model=Page[Review],
                    dependencies=[Depends(access_token_bearer), Depends(role_checker)])
-async def get_all_reviews(session: AsyncSession = Depends(get_session)):
+async def get_all_reviews(limit: int = Query(default=Config.PAGE_SIZE, ge=1, le=Config.MAX_PAGE_SIZE),
+                          cursor: Optional[str] = None,
+                          session: AsyncSession = Depends(get_session)):
     """
-    Return all reviews
+    Return page of reviews (newest first).
+    To get next page pass returned next_cursor as cursor param.
     """
-    reviews = await review_service.get_all_reviews(session)
+    reviews = await review_service.get_all_reviews(session, limit, cursor)
     return reviews
 
 
-@review_router.get('/user/{user_uid}', response_model=List[Review],
+@review_router.get('/export',
+                   response_class=StreamingResponse,
+                   dependencies=[Depends(access_token_bearer), Depends(role_checker)])
+async def export_reviews():
+    """
+    Stream all reviews from db as NDJSON (one review json per line)
+    """
+    return StreamingResponse(stream_ndjson(review_service.stream_reviews, Review),
+                             media_type='application/x-ndjson')
+
+
+@review_router.get('/user/{user_uid}', response_model=Page[Review],
                  dependencies=[Depends(access_token_bearer), Depends(role_checker)])
 async def get_all_reviews_created_by_user(
         user_uid: str,
+        limit: int = Query(default=Config.PAGE_SIZE, ge=1, le=Config.MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
         session: AsyncSession = Depends(get_session),
 ):
     """
-    Return all reviews from db that are created by specific user
+    Return page of reviews from db that are created by specific user (newest first)
     """
-    reviews = await review_service.get_user_created_reviews(user_uid, session)
+    reviews = await review_service.get_user_created_reviews(user_uid, session, limit, cursor)
     return reviews
 
 
 @review_router.post('/book/{book_uid}')
 async def add_review_to_book(book_uid: str,
                              review_data: ReviewCreateModel,
-                             user: User = Depends(get_current_user),
+                             token_details: dict = Depends(access_token_bearer),
                              session: AsyncSession = Depends(get_session)):
     """
-    Add review to a book
+    Add review to a book (by user from access token)
     """
-    review = await review_service.add_review(user.email, book_uid, review_data, session)
+    user_uid = token_details['user']['user_uid']
+    review = await review_service.add_review(user_uid, book_uid, review_data, session)
     return review
 
 
@@ -58,13 +78,21 @@ async def add_review_to_book(book_uid: str,
                  dependencies=[Depends(access_token_bearer), Depends(role_checker)])
 async def get_review(
         review_uid: str,
+        request: Request,
         session: AsyncSession = Depends(get_session),
 ):
     """
-    Return review based on review uid
+    Return review based on review uid.
+    Supports conditional GET - returns 304 without body if If-None-Match / If-Modified-Since still match.
     """
-    review = await review_service.get_review(review_uid, session)
-    if review:
-        return review
+    async def load_review():
+        review = await review_service.get_review(review_uid, session)
+        if review:
+            body = Review.model_validate(review, from_attributes=True).model_dump_json()
+            return pack_cached_body(make_etag(review.uid, review.update_date), review.update_date, body)
+
+    content = await get_or_set_cached(review_cache_key(review_uid), Config.REVIEW_CACHE_TTL, load_review)
+    if content:
+        return conditional_response(request, content)
 
     raise ReviewNotFoundException()
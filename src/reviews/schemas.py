@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class Review(BaseModel):
@@ -16,5 +16,5 @@ class Review(BaseModel):
 
 
 class ReviewCreateModel(BaseModel):
-    rating: int
+    rating: int = Field(ge=1, le=5)
     review_text: str
@@ -1,26 +1,41 @@
-from sqlmodel import select, desc
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import insert, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.auth.service import UserService
-from src.books.service import BookService
+from src.books.service import (BookService, BOOKS_CACHE_NAMESPACE, REVIEWS_CACHE_NAMESPACE, book_cache_key,
+                               review_cache_key)
+from src.config import Config
 from src.db.models import Review
+from src.db.pagination import paginate_by_create_date, build_page
+from src.db.redis import invalidate_cached
 from src.errors import BookNotFoundException, UserNotFoundException
 from .schemas import ReviewCreateModel
 
 book_service = BookService()
-user_service = UserService()
 
 
 class ReviewService:
-    async def get_all_reviews(self, session: AsyncSession):
-        statement = select(Review).order_by(desc(Review.create_date))
+    async def get_all_reviews(self, session: AsyncSession, limit: int, cursor: Optional[str] = None):
+        statement = paginate_by_create_date(select(Review), Review, limit, cursor)
         result = await session.exec(statement)
-        return result.all()
+        return build_page(result.all(), limit)
+
+    async def stream_reviews(self, session: AsyncSession):
+        # server-side cursor, yields batches of rows, so memory doesn't grow with table size
+        statement = select(Review.__table__).execution_options(yield_per=Config.EXPORT_BATCH_SIZE)
+        result = await session.stream(statement)
+        async for rows in result.partitions():
+            yield rows
 
-    async def get_user_created_reviews(self, user_uid: str, session: AsyncSession):
-        statement = select(Review).where(Review.user_uid == user_uid).order_by(desc(Review.create_date))
+    async def get_user_created_reviews(self, user_uid: str, session: AsyncSession,
+                                       limit: int, cursor: Optional[str] = None):
+        statement = paginate_by_create_date(select(Review).where(Review.user_uid == user_uid), Review, limit, cursor)
         result = await session.exec(statement)
-        return result.all()
+        return build_page(result.all(), limit)
 
     async def get_review(self, review_uid: str, session: AsyncSession):
         statement = select(Review).where(Review.uid == review_uid)
@@ -28,21 +43,33 @@ class ReviewService:
         review = result.first()
         return None or review
 
-    async def add_review(self, user_email: str, book_uid: str,
+    async def add_review(self, user_uid: str, book_uid: str,
                          review_data: ReviewCreateModel, session: AsyncSession):
-        book = await book_service.get_book(book_uid, session)
-        user = await user_service.get_user_by_email(user_email, session)
-
-        if not book:
+        """
+        Insert review, update rating aggregates and update_date of the book in one statement (one round trip).
+        User & book are not loaded, missing ones are detected from foreign key violation.
+        """
+        try:
+            book_uid = uuid.UUID(str(book_uid))
+        except ValueError:
             raise BookNotFoundException()
-        if not user:
-            raise UserNotFoundException()
 
-        review_data_dict = review_data.model_dump()
-        review = Review(**review_data_dict)
-        review.user = user
-        review.book = book
+        now = datetime.now()
+        review = Review(**review_data.model_dump(), uid=uuid.uuid4(), user_uid=uuid.UUID(str(user_uid)),
+                        book_uid=book_uid, create_date=now, update_date=now)
+        statement = (insert(Review)
+                     .values(**review.model_dump())
+                     .add_cte(book_service.add_rating_statement(book_uid, review.rating).cte('book_rating'))
+                     .add_cte(book_service.touch_book_statement(book_uid).cte('touched_book')))
+        try:
+            await session.exec(statement)
+            await session.commit()
+        except IntegrityError as err:
+            await session.rollback()
+            if '"users"' in str(err.orig):
+                raise UserNotFoundException()
+            raise BookNotFoundException()
 
-        session.add(review)
-        await session.commit()
+        # book details and listings show rating aggregates
+        await invalidate_cached(book_cache_key(book_uid), namespaces=(BOOKS_CACHE_NAMESPACE, REVIEWS_CACHE_NAMESPACE))
         return review
@@ -1,4 +1,10 @@
+import asyncio
+import uuid
+from unittest.mock import AsyncMock, Mock
+
 from src.auth.schemas import UserCreateModel
+from src.auth.service import UserService
+from src.db.models import Book, User
 
 auth_prefix = f'api/v1/auth'
 
@@ -21,3 +27,18 @@ def test_create_user_account(fake_db_session, fake_user_service, test_client):
     assert fake_user_service.user_exists_called_once(signup_data['email'], fake_db_session)
     assert fake_user_service.create_user_called_once()
     assert fake_user_service.create_user_called_once(user_create_data, fake_db_session)
+
+
+def test_load_user_books_queries_only_books():
+    user = User(uid=uuid.uuid4(), username='john doe', email='johndoe@gmail.com', first_name='john',
+                last_name='doe', password_hash='hash')
+    book = Book(uid=uuid.uuid4(), title='Mort', author='Terry Pratchett', publisher='Corgi',
+                page_count=272, language='English', user_uid=user.uid)
+    session = Mock(exec=AsyncMock(return_value=Mock(all=Mock(return_value=[book]))))
+
+    user_with_books = asyncio.run(UserService().load_user_books(user, session))
+
+    assert user_with_books is user
+    assert user.books == [book]
+    statement = session.exec.await_args.args[0]
+    assert [column['entity'] for column in statement.column_descriptions] == [Book]
@@ -0,0 +1,42 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+
+from src.db import redis
+from src.db.redis import BloomFilter
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom_filter = BloomFilter(capacity=1000, error_rate=0.001)
+    jtis = [f'jti-{i}' for i in range(1000)]
+    for jti in jtis:
+        bloom_filter.add(jti)
+
+    assert all(jti in bloom_filter for jti in jtis)
+    assert sum(f'other-{i}' in bloom_filter for i in range(1000)) < 10
+
+
+def test_token_in_blocklist_skips_redis_when_filter_is_fresh():
+    bloom_filter = BloomFilter(capacity=100, error_rate=0.001)
+    bloom_filter.add('revoked')
+
+    with patch.object(redis, 'blocklist_filter', bloom_filter), \
+            patch.object(redis, 'blocklist_filter_refreshed_at', time.monotonic()), \
+            patch.object(redis, 'token_blocklist') as fake_redis:
+        fake_redis.exists = AsyncMock(return_value=1)
+
+        assert asyncio.run(redis.token_in_blocklist('not-revoked')) is False
+        fake_redis.exists.assert_not_called()
+
+        assert asyncio.run(redis.token_in_blocklist('revoked')) is True
+        fake_redis.exists.assert_called_once_with('revoked')
+
+
+def test_token_in_blocklist_uses_redis_when_filter_is_stale():
+    with patch.object(redis, 'blocklist_filter', BloomFilter(capacity=100, error_rate=0.001)), \
+            patch.object(redis, 'blocklist_filter_refreshed_at', float('-inf')), \
+            patch.object(redis, 'token_blocklist') as fake_redis:
+        fake_redis.exists = AsyncMock(return_value=0)
+
+        assert asyncio.run(redis.token_in_blocklist('jti')) is False
+        fake_redis.exists.assert_called_once_with('jti')
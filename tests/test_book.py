@@ -1,4 +1,28 @@
-from src.books.schemas import BookCreateModel
+import asyncio
+import json
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.schema import CreateTable
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src import app
+from src.auth.dependencies import access_token_bearer
+from src.books import bulk
+from src.books.routes import role_checker
+from src.books.schemas import Book, BookCreateModel, BookUpdateModel
+from src.db.export import stream_ndjson
+from src.db.main import get_session
+from src.db.models import Book as BookModel, BookRating
+from src.errors import ImportLineTooLongException, PreconditionFailedException
+from src.etags import make_etag
+from src.books.service import (BookService, BOOKS_CACHE_NAMESPACE, REVIEWS_CACHE_NAMESPACE, book_cache_key,
+                               review_cache_key)
 
 books_prefix = f"/api/v1/books"
 
@@ -30,8 +54,168 @@ def test_create_book(test_client, fake_book_service, fake_db_session):
     assert fake_book_service.create_book_called_once_with(book_create_data, fake_db_session)
 
 
+def sqlite_session_maker():
+    pytest.importorskip('aiosqlite')
+    engine = create_async_engine('sqlite+aiosqlite://')
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            # tables only, postgres specific indexes can't be created in sqlite
+            await conn.execute(CreateTable(BookModel.__table__))
+            await conn.execute(CreateTable(BookRating.__table__))
+
+    asyncio.run(create_tables())
+    return engine, async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+def test_create_book_returns_created_book():
+    engine, session_maker = sqlite_session_maker()
+
+    async def get_sqlite_session():
+        async with session_maker() as session:
+            yield session
+
+    overrides = {
+        get_session: get_sqlite_session,
+        access_token_bearer: lambda: {'user': {'user_uid': uuid.uuid4()}},
+        role_checker: lambda: True,
+    }
+    previous = {dependency: app.dependency_overrides.get(dependency) for dependency in overrides}
+    app.dependency_overrides.update(overrides)
+    try:
+        with patch('src.books.service.invalidate_cached', AsyncMock()):
+            response = TestClient(app, base_url='http://localhost').post(f'{books_prefix}/', json={
+                'title': 'Mort', 'author': 'Terry Pratchett', 'publisher': 'Corgi',
+                'page_count': 272, 'language': 'English',
+            })
+    finally:
+        for dependency, override in previous.items():
+            if override is None:
+                app.dependency_overrides.pop(dependency, None)
+            else:
+                app.dependency_overrides[dependency] = override
+        asyncio.run(engine.dispose())
+
+    assert response.status_code == 201
+    assert response.json()['title'] == 'Mort'
+    assert response.json()['rating'] is None
+
+
 def test_get_book(test_client, fake_book_service,test_book, fake_db_session):
     response = test_client.get(f"{books_prefix}/{test_book.uid}")
 
     assert fake_book_service.get_book_called_once()
     assert fake_book_service.get_book_called_once_with(test_book.uid,fake_db_session)
+
+
+async def stream_body(data: bytes, chunk_size: int = 10):
+    for i in range(0, len(data), chunk_size):
+        yield data[i:i + chunk_size]
+
+
+def test_bulk_import_reports_invalid_rows(fake_db_session):
+    body = (b'title,author,publisher,page_count,language\n'
+            b'The Color of Magic,Terry Pratchett,Corgi,287,English\n'
+            b'Mort,Terry Pratchett,Corgi,not a number,English\n')
+
+    with patch.object(bulk.book_service, 'bulk_create_books', AsyncMock()) as fake_bulk_create:
+        result = asyncio.run(bulk.import_books(stream_body(body), True, 'user_uid', fake_db_session))
+
+    assert result.inserted == 1
+    assert result.failed == 1
+    assert result.errors[0]['line'] == 3
+    fake_bulk_create.assert_awaited_once()
+
+
+def test_get_books_by_uids_keeps_request_order():
+    books = [SimpleNamespace(uid=uuid.uuid4()) for _ in range(3)]
+    missing_uid = uuid.uuid4()
+    session = Mock(exec=AsyncMock(return_value=Mock(all=Mock(return_value=books))))
+    requested = [books[2].uid, missing_uid, books[0].uid, books[2].uid, books[1].uid]
+
+    found, missing = asyncio.run(BookService().get_books_by_uids(requested, session))
+
+    assert found == [books[2], books[0], books[1]]
+    assert missing == [missing_uid]
+    session.exec.assert_awaited_once()
+
+
+def test_bulk_import_rejects_too_long_line():
+    async def read_all(body):
+        return [line async for line in bulk.iter_lines(stream_body(body))]
+
+    assert asyncio.run(read_all(b'a\r\nbb\n\nccc')) == ['a', 'bb', '', 'ccc']
+    with patch('src.books.bulk.Config.BULK_IMPORT_MAX_LINE_LENGTH', 50):
+        with pytest.raises(ImportLineTooLongException):
+            asyncio.run(read_all(b'x' * 100))
+
+
+def test_export_includes_book_rating():
+    engine, session_maker = sqlite_session_maker()
+    rated_book = BookModel(uid=uuid.uuid4(), title='Mort', author='Terry Pratchett', publisher='Corgi',
+                           page_count=272, language='English')
+    new_book = BookModel(uid=uuid.uuid4(), title='Eric', author='Terry Pratchett', publisher='Corgi',
+                         page_count=160, language='English')
+
+    async def export():
+        async with session_maker() as session:
+            session.add_all([rated_book, new_book, BookRating(book_uid=rated_book.uid, review_count=2, rating_sum=9,
+                                                              rating_avg=4.5, rating_4=1, rating_5=1)])
+            await session.commit()
+        with patch('src.db.export.async_session_maker', session_maker):
+            return ''.join([lines async for lines in stream_ndjson(BookService().stream_books, Book)])
+
+    try:
+        lines = [json.loads(line) for line in asyncio.run(export()).splitlines()]
+    finally:
+        asyncio.run(engine.dispose())
+
+    ratings = {line['title']: line['rating'] for line in lines}
+    assert ratings['Mort']['rating_avg'] == 4.5
+    assert ratings['Mort']['review_count'] == 2
+    assert ratings['Eric'] is None
+
+
+def test_update_book_rejects_etag_of_other_book():
+    engine, session_maker = sqlite_session_maker()
+    book = BookModel(uid=uuid.uuid4(), title='Mort', author='Terry Pratchett', publisher='Corgi',
+                     page_count=272, language='English')
+    update_data = BookUpdateModel(title='Mort', author='Terry Pratchett', publisher='Corgi',
+                                  page_count=288, language='English')
+
+    async def update(etag_uid):
+        async with session_maker() as session:
+            return await BookService().update_book(book.uid, update_data, session,
+                                                   if_match=make_etag(etag_uid, book.update_date))
+
+    async def run():
+        async with session_maker() as session:
+            session.add(book)
+            await session.commit()
+        with pytest.raises(PreconditionFailedException):
+            await update(uuid.uuid4())  # other book with the same update_date
+        return await update(book.uid)
+
+    try:
+        with patch('src.books.service.invalidate_cached', AsyncMock()):
+            updated_book = asyncio.run(run())
+    finally:
+        asyncio.run(engine.dispose())
+
+    assert updated_book.page_count == 288
+
+
+def test_delete_book_invalidates_orphaned_reviews():
+    book_uid, review_uids = uuid.uuid4(), [uuid.uuid4(), uuid.uuid4()]
+    session = Mock(exec=AsyncMock(return_value=Mock(first=Mock(return_value=(book_uid, review_uids)))),
+                   commit=AsyncMock())
+    invalidate_cached = AsyncMock()
+
+    with patch('src.books.service.invalidate_cached', invalidate_cached):
+        assert asyncio.run(BookService().delete_book(book_uid, session))
+
+    statement = str(session.exec.await_args.args[0].compile(dialect=postgresql.dialect()))
+    assert 'UPDATE reviews SET book_uid=%(param_1)s::UUID, update_date=' in statement
+    invalidate_cached.assert_awaited_once_with(
+        book_cache_key(book_uid), *[review_cache_key(uid) for uid in review_uids],
+        namespaces=(BOOKS_CACHE_NAMESPACE, REVIEWS_CACHE_NAMESPACE))
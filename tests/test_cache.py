@@ -0,0 +1,60 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+from src.cache import TTLCache
+from src.db import redis
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_cache_entry_expires():
+    cache = TTLCache(maxsize=2, ttl=60)
+    with patch('src.cache.time.monotonic', return_value=100):
+        cache.set('a', 1)
+
+    with patch('src.cache.time.monotonic', return_value=159):
+        assert cache.get('a') == 1
+
+    with patch('src.cache.time.monotonic', return_value=160):
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+
+def test_cache_invalidate_and_disabled_cache():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.invalidate('a')
+    assert cache.get('a') is None
+
+    disabled_cache = TTLCache(maxsize=2, ttl=0)
+    disabled_cache.set('a', 1)
+    assert disabled_cache.get('a') is None
+
+
+def test_value_built_before_invalidation_is_stored_under_old_version():
+    async def build():
+        await redis.invalidate_cached('book:1')  # book updated while response was built
+        return b'old body'
+
+    with patch.object(redis, 'cache_get_script', AsyncMock(return_value=[b'3', None])) as fake_get, \
+            patch.object(redis, 'token_blocklist') as fake_redis:
+        pipe = Mock(execute=AsyncMock())
+        fake_redis.pipeline = Mock(return_value=MagicMock(__aenter__=AsyncMock(return_value=pipe)))
+        fake_redis.set = AsyncMock()
+
+        assert asyncio.run(redis.get_or_set_cached('book:1', 60, build)) == b'old body'
+
+    fake_get.assert_awaited_once_with(keys=['cache:book:1:version'], args=['cache:book:1:v'])
+    pipe.incr.assert_called_once_with('cache:book:1:version')
+    # next read gets version 4, so this value is never returned
+    fake_redis.set.assert_awaited_once_with('cache:book:1:v3', b'old body', ex=60)
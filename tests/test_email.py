@@ -0,0 +1,147 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+import aiosmtplib
+import pytest
+from celery.exceptions import Retry
+
+from src import celery_tasks
+from src.db import outbox
+from src.mail import SMTPMailer, render_email
+
+
+def make_emails(count: int) -> list[dict]:
+    return [{'recipients': [f'user{i}@example.com'], 'template_id': 'verify_email',
+             'params': {'link': f'http://localhost/verify/{i}'}} for i in range(count)]
+
+
+def test_render_email_substitutes_escaped_params():
+    subject, body = render_email('password_reset', {'link': 'http://localhost/reset?a=1&b=2'})
+
+    assert subject == 'Reset password'
+    assert 'href="http://localhost/reset?a=1&amp;b=2"' in body
+
+
+def test_send_email_batch_uses_one_mailer():
+    with patch.object(celery_tasks.mailer, 'send_message', AsyncMock()) as fake_send:
+        celery_tasks.send_email_batch_task.apply(args=[make_emails(3)])
+
+    assert fake_send.await_count == 3
+    message = fake_send.await_args.args[0]
+    assert message.subject == 'Verify your email'
+    assert 'http://localhost/verify/2' in message.body
+
+
+def test_mailer_logs_in_again_after_failed_login():
+    config = Mock(USE_CREDENTIALS=True, SUPPRESS_SEND=False, MAIL_FROM='noreply@books.com', MAIL_FROM_NAME=None)
+    failed, connected = (Mock(connect=AsyncMock(), login=AsyncMock(), send_message=AsyncMock(), is_connected=True)
+                         for _ in range(2))
+    failed.login.side_effect = aiosmtplib.SMTPAuthenticationError(454, 'try again later')
+    mailer = SMTPMailer(config)
+    message = celery_tasks.create_message(['user0@doe.com'], 'Subject', 'Body')
+
+    async def send_twice():
+        with pytest.raises(aiosmtplib.SMTPAuthenticationError):
+            await mailer.send_message(message)
+        await mailer.send_message(message)
+
+    with patch('src.mail.aiosmtplib.SMTP', Mock(side_effect=[failed, connected])):
+        asyncio.run(send_twice())
+
+    failed.close.assert_called_once()
+    failed.send_message.assert_not_awaited()
+    connected.login.assert_awaited_once()
+    connected.send_message.assert_awaited_once()
+    assert mailer.smtp is connected
+
+
+def test_send_emails_skips_rejected_email():
+    emails = make_emails(3)
+    refused = aiosmtplib.SMTPRecipientsRefused([aiosmtplib.SMTPRecipientRefused(550, 'no such user', 'user1')])
+    send = AsyncMock(side_effect=[None, refused, None])
+
+    with patch.object(celery_tasks.mailer, 'send_message', send):
+        asyncio.run(celery_tasks.send_emails(emails))
+
+    assert send.await_count == 3
+
+
+def test_send_email_batch_retries_unsent_emails_on_connection_error():
+    emails = make_emails(3)
+    send = AsyncMock(side_effect=[None, aiosmtplib.SMTPConnectError('down')])
+
+    with patch.object(celery_tasks.mailer, 'send_message', send), \
+            patch.object(celery_tasks.send_email_batch_task, 'retry', Mock(side_effect=Retry())) as fake_retry:
+        with pytest.raises(Retry):
+            celery_tasks.send_email_batch_task.run(emails)
+
+    assert fake_retry.call_args.kwargs['args'] == [emails[1:]]
+
+
+def test_send_email_batch_doesnt_retry_rejected_email():
+    refused = aiosmtplib.SMTPRecipientsRefused([aiosmtplib.SMTPRecipientRefused(550, 'no such user', 'user0')])
+    send = AsyncMock(side_effect=[refused, None, None])
+
+    with patch.object(celery_tasks.mailer, 'send_message', send), \
+            patch.object(celery_tasks.send_email_batch_task, 'retry') as fake_retry:
+        celery_tasks.send_email_batch_task.run(make_emails(3))
+
+    assert send.await_count == 3
+    fake_retry.assert_not_called()
+
+
+def test_send_email_batch_retries_temporarily_rejected_email():
+    emails = make_emails(3)
+    deferred = aiosmtplib.SMTPRecipientsRefused([aiosmtplib.SMTPRecipientRefused(450, 'mailbox busy', 'user1')])
+    send = AsyncMock(side_effect=[None, deferred])
+
+    with patch.object(celery_tasks.mailer, 'send_message', send), \
+            patch.object(celery_tasks.send_email_batch_task, 'retry', Mock(side_effect=Retry())) as fake_retry:
+        with pytest.raises(Retry):
+            celery_tasks.send_email_batch_task.run(emails)
+
+    assert send.await_count == 2
+    assert fake_retry.call_args.kwargs['args'] == [emails[1:]]
+
+
+def test_send_emails_skips_emails_that_cant_be_built():
+    emails = [
+        {'recipients': ['old@example.com'], 'subject': 's', 'body': 'b'},  # queued before templates
+        {'recipients': ['unknown@example.com'], 'template_id': 'unknown', 'params': {}},
+        {'recipients': ['broken@example.com'], 'template_id': 'verify_email'},
+        {'recipients': ['new@example.com'], 'template_id': 'prerendered', 'params': {'subject': 's', 'body': 'b'}},
+    ]
+
+    with patch.object(celery_tasks.mailer, 'send_message', AsyncMock()) as fake_send:
+        asyncio.run(celery_tasks.send_emails(emails))
+
+    assert [call.args[0].recipients[0] for call in fake_send.await_args_list] == ['old@example.com', 'new@example.com']
+
+
+def outbox_session(emails: list[dict]) -> Mock:
+    rows = [Mock(_mapping=email) for email in emails]
+    return Mock(exec=AsyncMock(return_value=Mock(all=Mock(return_value=rows))),
+                commit=AsyncMock(), rollback=AsyncMock())
+
+
+def test_relay_publishes_outbox_batch_and_commits():
+    emails = make_emails(2)
+    session = outbox_session(emails)
+
+    with patch.object(outbox.send_email_batch_task, 'delay') as fake_delay:
+        relayed = asyncio.run(outbox.relay_outbox_emails(session))
+
+    assert relayed == 2
+    fake_delay.assert_called_once_with(emails)
+    session.commit.assert_awaited_once()
+
+
+def test_relay_keeps_outbox_rows_if_publish_fails():
+    session = outbox_session(make_emails(2))
+
+    with patch.object(outbox.send_email_batch_task, 'delay', side_effect=ConnectionError('broker is down')):
+        with pytest.raises(ConnectionError):
+            asyncio.run(outbox.relay_outbox_emails(session))
+
+    session.rollback.assert_awaited_once()
+    session.commit.assert_not_awaited()
@@ -0,0 +1,52 @@
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from src.etags import conditional_response, etag_matches, etag_versions, http_date, make_etag, pack_cached_body
+
+
+def make_request(**headers):
+    return SimpleNamespace(headers={name.replace('_', '-'): value for name, value in headers.items()})
+
+
+def test_etag_changes_with_update_date():
+    uid = uuid.uuid4()
+    update_date = datetime.now()
+
+    assert make_etag(uid, update_date) == make_etag(uid, update_date)
+    assert make_etag(uid, update_date) != make_etag(uid, update_date + timedelta(microseconds=1))
+
+
+def test_etag_versions_skip_unknown_and_weak_etags():
+    uid = uuid.uuid4()
+    update_date = datetime.now()
+    etag = make_etag(uid, update_date)
+
+    assert etag_versions(f'"unknown", {etag}') == [(uid, update_date)]
+    assert etag_versions(f'W/{etag}') == []
+
+
+def test_etag_matches_list_and_wildcard():
+    etag = make_etag(uuid.uuid4(), datetime.now())
+
+    assert etag_matches(f'"other", {etag}', etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_conditional_response():
+    update_date = datetime.now()
+    etag = make_etag(uuid.uuid4(), update_date)
+    cached_body = pack_cached_body(etag, update_date, '{"title":"Mort"}')
+
+    response = conditional_response(make_request(), cached_body)
+    assert response.status_code == 200
+    assert response.body == b'{"title":"Mort"}'
+    assert response.headers['etag'] == etag
+
+    assert conditional_response(make_request(if_none_match=etag), cached_body).status_code == 304
+    assert conditional_response(make_request(if_none_match='"other"'), cached_body).status_code == 200
+    assert conditional_response(make_request(if_modified_since=http_date(update_date)), cached_body).status_code == 304
+    older = http_date(update_date - timedelta(days=1))
+    assert conditional_response(make_request(if_modified_since=older), cached_body).status_code == 200
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from src.db.loaders import DataLoader
+
+
+def make_loader(calls: list) -> DataLoader:
+    async def batch_load(keys):
+        calls.append(keys)
+        return {key: key * 10 for key in keys if key != 0}
+
+    return DataLoader(batch_load, asyncio.Lock())
+
+
+def test_loads_of_same_tick_are_coalesced_and_memoised():
+    calls = []
+
+    async def run():
+        loader = make_loader(calls)
+        values = await asyncio.gather(loader.load(1), loader.load(2), loader.load(1), loader.load(0))
+        again = await loader.load(2)
+        return values, again
+
+    values, again = asyncio.run(run())
+
+    assert values == [10, 20, 10, None]
+    assert again == 20
+    assert calls == [[1, 2, 0]]
+
+
+def test_failed_batch_is_not_memoised():
+    attempts = []
+
+    async def batch_load(keys):
+        attempts.append(keys)
+        if len(attempts) == 1:
+            raise ValueError('db is down')
+        return {key: key for key in keys}
+
+    async def run():
+        loader = DataLoader(batch_load, asyncio.Lock())
+        with pytest.raises(ValueError):
+            await loader.load(1)
+        return await loader.load(1)
+
+    assert asyncio.run(run()) == 1
+    assert attempts == [[1], [1]]
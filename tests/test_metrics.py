@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from src import app
+from src.auth.utils import run_password_hashing
+
+
+def test_metrics_endpoint_has_route_template_labels():
+    client = TestClient(app, base_url='http://localhost')
+    labels = {'method': 'GET', 'route': '/api/v1/books/{book_uid}', 'status': '403'}
+    before = REGISTRY.get_sample_value('http_request_duration_seconds_count', labels) or 0
+
+    client.get('/api/v1/books/123')
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds' in response.text
+    assert REGISTRY.get_sample_value('http_request_duration_seconds_count', labels) == before + 1
+
+
+def test_password_hash_calls_are_counted_by_result():
+    def sample(result):
+        return REGISTRY.get_sample_value('password_hash_calls_total', {'result': result}) or 0
+
+    def fail(password):
+        raise ValueError('bad hash')
+
+    before = {result: sample(result) for result in ('completed', 'failed')}
+
+    asyncio.run(run_password_hashing('hash', str.upper, 'secret'))
+    with pytest.raises(ValueError):
+        asyncio.run(run_password_hashing('verify', fail, 'secret'))
+
+    assert sample('completed') == before['completed'] + 1
+    assert sample('failed') == before['failed'] + 1
+    assert REGISTRY.get_sample_value('password_hash_pool_calls', {'state': 'queued'}) == 0
@@ -0,0 +1,106 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from src import app
+from src.middleware import (AdmissionControlMiddleware, AdmissionGroup, JsonFormatter, access_log_queue,
+                            admission_route_groups)
+
+
+def drain_access_log() -> list:
+    records = []
+    while not access_log_queue.empty():
+        records.append(access_log_queue.get_nowait())
+    return records
+
+
+def test_access_log_has_route_template_and_status():
+    drain_access_log()
+    client = TestClient(app, base_url='http://localhost')
+
+    client.get('/api/v1/books/123')
+
+    record, = drain_access_log()
+    line = json.loads(JsonFormatter().format(record))
+    assert line['method'] == 'GET'
+    assert line['path'] == '/api/v1/books/{book_uid}'
+    assert line['status'] == 403
+    assert line['duration_ms'] >= 0
+
+
+def test_successful_requests_are_sampled():
+    drain_access_log()
+    client = TestClient(app, base_url='http://localhost')
+
+    with patch('src.middleware.Config.ACCESS_LOG_SUCCESS_SAMPLE_RATE', 0.0):
+        client.get('/openapi.json')
+        client.get('/api/v1/books/123')
+
+    assert [record.msg['status'] for record in drain_access_log()] == [403]
+
+
+def test_admission_group_queues_and_hands_over_slots():
+    async def run():
+        group = AdmissionGroup('books', limit=1, queue_size=1)
+        assert await group.acquire(timeout=1)
+
+        waiter = asyncio.create_task(group.acquire(timeout=1))
+        await asyncio.sleep(0)
+        assert not await group.acquire(timeout=1)  # queue is full
+
+        group.release()
+        assert await waiter
+        assert group.active == 1 and not group.waiters
+
+        assert not await group.acquire(timeout=0.01)  # wait timed out
+        assert not group.waiters
+
+    asyncio.run(run())
+
+
+def test_saturated_group_doesnt_block_other_groups():
+    release_listing = asyncio.Event()
+
+    async def app(scope, receive, send):
+        if scope['path'].startswith('/api/v1/books'):
+            await release_listing.wait()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    middleware = AdmissionControlMiddleware(app, admission_route_groups('/api/v1'), limits={'books': 1, 'light': 1},
+                                            queue_size=0, queue_timeout=1)
+
+    async def call(path):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await middleware({'type': 'http', 'path': path, 'method': 'GET', 'headers': []}, None, send)
+        return messages[0]['status'], dict(messages[0]['headers'])
+
+    async def run():
+        listing = asyncio.create_task(call('/api/v1/books'))
+        await asyncio.sleep(0)
+        rejected = await call('/api/v1/books')
+        refresh = await call('/api/v1/auth/refresh_access_token')
+        release_listing.set()
+        return rejected, refresh, await listing
+
+    (rejected_status, rejected_headers), refresh, listing = asyncio.run(run())
+
+    assert rejected_status == 503
+    assert rejected_headers[b'retry-after'] == b'1'
+    assert refresh[0] == 200
+    assert listing[0] == 200
+
+
+def test_exports_have_own_admission_group():
+    middleware = AdmissionControlMiddleware(None, admission_route_groups('/api/v2'),
+                                            limits={'books': 1, 'streams': 1}, queue_size=0, queue_timeout=1)
+
+    assert middleware.route_group('/api/v2/books/export').name == 'streams'
+    assert middleware.route_group('/api/v2/books/123').name == 'books'
+    assert middleware.route_group('/api/v1/books/123') is None
@@ -0,0 +1,40 @@
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from src.db.pagination import build_page, build_rank_page, decode_create_date_cursor, decode_rank_cursor, encode_cursor
+from src.errors import InvalidCursorException
+
+
+def test_build_page_returns_cursor_of_last_item():
+    rows = [SimpleNamespace(uid=uuid.uuid4(), create_date=datetime.now()) for _ in range(3)]
+
+    page = build_page(rows, limit=2)
+
+    assert page['items'] == rows[:2]
+    assert decode_create_date_cursor(page['next_cursor']) == (rows[1].create_date, rows[1].uid)
+
+
+def test_build_page_last_page_has_no_cursor():
+    rows = [SimpleNamespace(uid=uuid.uuid4(), create_date=datetime.now()) for _ in range(2)]
+
+    page = build_page(rows, limit=2)
+
+    assert page['next_cursor'] is None
+
+
+def test_build_rank_page_returns_items_and_cursor_of_last_item():
+    rows = [(SimpleNamespace(uid=uuid.uuid4()), rank) for rank in (0.9, 0.1 + 0.2, 0.1)]
+
+    page = build_rank_page(rows, limit=2)
+
+    assert page['items'] == [rows[0][0], rows[1][0]]
+    assert decode_rank_cursor(page['next_cursor']) == (0.1 + 0.2, rows[1][0].uid)
+
+
+@pytest.mark.parametrize('cursor', ['not a cursor', encode_cursor({'uid': 'abc'}), encode_cursor([1, 2])])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursorException):
+        decode_create_date_cursor(cursor)
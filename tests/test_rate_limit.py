@@ -0,0 +1,94 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import app
+from src.auth.dependencies import denied_buckets, leased_tokens, recent_requests, take_rate_limit_token
+from src.errors import RateLimitExceededException
+
+
+@pytest.fixture(autouse=True)
+def clear_rate_limit_caches():
+    clear_local_state()
+    yield
+    clear_local_state()
+
+
+def clear_local_state():
+    for cache in (leased_tokens, recent_requests, denied_buckets):
+        cache.clear()
+
+
+def fake_bucket(tokens: int) -> AsyncMock:
+    # bucket without refill, grants up to requested tokens while it has some
+    bucket = [tokens]
+
+    async def take_bucket_tokens(key, capacity, period, requested):
+        granted = min(requested, bucket[0])
+        bucket[0] -= granted
+        return granted, 0 if granted else 30
+
+    return AsyncMock(side_effect=take_bucket_tokens)
+
+
+def test_bursting_bucket_leases_tokens_spent_without_redis():
+    take_bucket_tokens = fake_bucket(20)
+
+    async def run():
+        for _ in range(10):
+            await take_rate_limit_token('login:ip:1.2.3.4', 20, 60)
+
+    with patch('src.auth.dependencies.take_bucket_tokens', take_bucket_tokens):
+        asyncio.run(run())
+
+    # lease grows with requests seen in lease window: 1, 2, 4, 5 tokens
+    assert [call.args[3] for call in take_bucket_tokens.await_args_list] == [1, 2, 4, 5]
+
+
+def test_sparse_requests_are_allowed_up_to_capacity():
+    take_bucket_tokens = fake_bucket(20)
+
+    async def run():
+        for _ in range(20):
+            await take_rate_limit_token('login:ip:1.2.3.4', 20, 60)
+            leased_tokens.clear()  # lease window passed before next request
+            recent_requests.clear()
+        with pytest.raises(RateLimitExceededException):
+            await take_rate_limit_token('login:ip:1.2.3.4', 20, 60)
+
+    with patch('src.auth.dependencies.take_bucket_tokens', take_bucket_tokens):
+        asyncio.run(run())
+
+    assert take_bucket_tokens.await_count == 21
+
+
+def test_empty_bucket_is_denied_locally_until_refill():
+    take_bucket_tokens = AsyncMock(return_value=(0, 12.5))
+
+    async def run():
+        with pytest.raises(RateLimitExceededException) as first:
+            await take_rate_limit_token('login:email:john@doe.com', 5, 60)
+        with pytest.raises(RateLimitExceededException) as second:
+            await take_rate_limit_token('login:email:john@doe.com', 5, 60)
+        return first.value, second.value
+
+    with patch('src.auth.dependencies.take_bucket_tokens', take_bucket_tokens):
+        first, second = asyncio.run(run())
+
+    assert first.retry_after == 13
+    assert second.retry_after <= 13
+    take_bucket_tokens.assert_awaited_once_with('login:email:john@doe.com', 5, 60, 1)
+
+
+def test_limited_login_returns_429_with_retry_after():
+    client = TestClient(app, base_url='http://localhost')
+    take_bucket_tokens = AsyncMock(side_effect=[(1, 0), (0, 30)])
+
+    with patch('src.auth.dependencies.take_bucket_tokens', take_bucket_tokens):
+        response = client.post('/api/v1/auth/login', json={'email': 'John@Doe.com', 'password': '12345'})
+
+    assert response.status_code == 429
+    assert response.headers['retry-after'] == '30'
+    assert take_bucket_tokens.await_args.args[0] == 'login:email:john@doe.com'
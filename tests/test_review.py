@@ -0,0 +1,36 @@
+import asyncio
+import uuid
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from src.errors import BookNotFoundException, UserNotFoundException
+from src.reviews.schemas import ReviewCreateModel
+from src.reviews.service import ReviewService
+
+
+def fk_violation(table: str) -> IntegrityError:
+    return IntegrityError('INSERT', {}, Exception(f'Key (uid) is not present in table "{table}".'))
+
+
+def test_add_review_is_one_statement():
+    session = Mock(exec=AsyncMock(), commit=AsyncMock())
+    review_data = ReviewCreateModel(rating=4, review_text='Great')
+
+    with patch('src.reviews.service.invalidate_cached', AsyncMock()):
+        review = asyncio.run(ReviewService().add_review(str(uuid.uuid4()), str(uuid.uuid4()), review_data, session))
+
+    assert review.rating == 4
+    session.exec.assert_awaited_once()
+    session.commit.assert_awaited_once()
+
+
+@pytest.mark.parametrize('table, exception', [('users', UserNotFoundException), ('books', BookNotFoundException)])
+def test_add_review_maps_foreign_key_violation(table, exception):
+    session = Mock(exec=AsyncMock(side_effect=fk_violation(table)), rollback=AsyncMock())
+    review_data = ReviewCreateModel(rating=4, review_text='Great')
+
+    with pytest.raises(exception):
+        asyncio.run(ReviewService().add_review(str(uuid.uuid4()), str(uuid.uuid4()), review_data, session))
+    session.rollback.assert_awaited_once()